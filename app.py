@@ -1,16 +1,25 @@
 import streamlit as st
-import psycopg2
+from psycopg2 import pool
 import pandas as pd
 import os
+import io
 from datetime import datetime
 import time
 import logging
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Callable
 from groq import Groq
+import sqlglot
+from sqlglot import exp
 import re
-from decimal import Decimal
 from contextlib import contextmanager
-import json
+from collections import deque
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor
+import queue
+import threading
+import httpx
+
+logger = logging.getLogger(__name__)
 
 # Set page config
 st.set_page_config(
@@ -65,81 +74,411 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
+# Indexes for the predicates generated SQL filters on most: ILIKE name and
+# bowling-type searches (trigram GIN) plus phase/validity and wicket filters
+INDEX_DDL = (
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS ipl_batter_trgm ON ipl_data USING gin (batter_full_name gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS ipl_bowler_trgm ON ipl_data USING gin (bowler_full_name gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS ipl_bowling_type_trgm ON ipl_data USING gin (bowling_type gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS ipl_phase ON ipl_data (over_col) WHERE valid_ball = 1",
+    "CREATE INDEX IF NOT EXISTS ipl_wicket ON ipl_data (bowler_full_name) WHERE is_wicket = true",
+)
+
+# Pre-aggregated rollups of ipl_data: name -> (SELECT, unique key columns).
+# Grouping by player x matchup x phase turns most questions into a lookup over
+# a few thousand rows instead of a scan over every ball.
+PHASE_SQL = "CASE WHEN over_col BETWEEN 1 AND 6 THEN 'PP' WHEN over_col BETWEEN 7 AND 15 THEN 'MID' ELSE 'DEATH' END"
+
+ROLLUP_VIEWS = {
+    "mv_batter_vs_type": (
+        f"""SELECT batter_full_name, bowling_type, {PHASE_SQL} AS phase,
+               SUM(runs_batter) AS runs,
+               COUNT(CASE WHEN valid_ball = 1 THEN 1 END) AS balls,
+               COUNT(CASE WHEN is_wicket = true THEN 1 END) AS outs,
+               COUNT(CASE WHEN is_four = true THEN 1 END) AS fours,
+               COUNT(CASE WHEN is_six = true THEN 1 END) AS sixes
+        FROM ipl_data
+        WHERE batter_full_name IS NOT NULL
+        GROUP BY 1, 2, 3""",
+        ("batter_full_name", "bowling_type", "phase"),
+    ),
+    "mv_bowler_vs_hand": (
+        f"""SELECT bowler_full_name, bat_hand, {PHASE_SQL} AS phase,
+               SUM(runs_total) AS runs,
+               COUNT(CASE WHEN valid_ball = 1 THEN 1 END) AS balls,
+               COUNT(CASE WHEN is_wicket = true THEN 1 END) AS wickets
+        FROM ipl_data
+        WHERE bowler_full_name IS NOT NULL
+        GROUP BY 1, 2, 3""",
+        ("bowler_full_name", "bat_hand", "phase"),
+    ),
+    # Per-season totals: past seasons never change, so season and
+    # season-range questions sum a handful of rows per player
+    "mv_batter_season": (
+        """SELECT batter_full_name, season,
+               COUNT(DISTINCT match_id) AS matches,
+               SUM(runs_batter) AS runs,
+               COUNT(CASE WHEN valid_ball = 1 THEN 1 END) AS balls,
+               COUNT(CASE WHEN is_wicket = true THEN 1 END) AS outs,
+               COUNT(CASE WHEN is_four = true THEN 1 END) AS fours,
+               COUNT(CASE WHEN is_six = true THEN 1 END) AS sixes
+        FROM ipl_data
+        WHERE batter_full_name IS NOT NULL
+        GROUP BY 1, 2""",
+        ("batter_full_name", "season"),
+    ),
+    "mv_bowler_season": (
+        """SELECT bowler_full_name, season,
+               COUNT(DISTINCT match_id) AS matches,
+               SUM(runs_total) AS runs,
+               COUNT(CASE WHEN valid_ball = 1 THEN 1 END) AS balls,
+               COUNT(CASE WHEN is_wicket = true THEN 1 END) AS wickets
+        FROM ipl_data
+        WHERE bowler_full_name IS NOT NULL
+        GROUP BY 1, 2""",
+        ("bowler_full_name", "season"),
+    ),
+}
+
+ROLLUP_DDL = tuple(
+    statement
+    for name, (select_sql, key_columns) in ROLLUP_VIEWS.items()
+    for statement in (
+        f"CREATE MATERIALIZED VIEW IF NOT EXISTS {name} AS {select_sql}",
+        # A unique index is required for REFRESH ... CONCURRENTLY
+        f"CREATE UNIQUE INDEX IF NOT EXISTS {name}_key ON {name} ({', '.join(key_columns)})",
+    )
+)
+
+# How often the rollups are rebuilt from ipl_data (nightly by default); each
+# refresh re-aggregates the whole table, and 0 disables it
+ROLLUP_REFRESH_SECONDS = int(os.getenv("ROLLUP_REFRESH_SECONDS", str(24 * 60 * 60)))
+
+# COPY results are parsed from CSV: NULLs get an explicit marker and columns
+# are typed from the Postgres type OIDs (anything not listed stays text)
+COPY_NULL = r"\N"
+COPY_DTYPES = {
+    16: "boolean",                                  # bool
+    20: "Int64", 21: "Int64", 23: "Int64",          # int8, int2, int4
+    700: "float64", 701: "float64", 1700: "float64" # float4, float8, numeric
+}
+
 # Database connection class
 class DatabaseManager:
-    def __init__(self, database_url: str):
+    def __init__(self, database_url: str, minconn: int = 2, maxconn: int = 16, parquet_path: Optional[str] = None):
         self.database_url = database_url
+        # One pool per process; connections are reused across queries and reruns
+        self._pool = pool.ThreadedConnectionPool(minconn=minconn, maxconn=maxconn, dsn=database_url)
+        # Optional in-process DuckDB engine over a Parquet snapshot of ipl_data
+        self._duck = self._open_duckdb(parquet_path) if parquet_path else None
+        # DuckDB builds the rollups on load; Postgres only has them once ensure_rollups succeeds
+        self.has_rollups = self._duck is not None
+    
+    @staticmethod
+    def _open_duckdb(parquet_path: str):
+        """Serve ipl_data and its rollups from a Parquet snapshot via DuckDB"""
+        import duckdb
+        
+        duck = duckdb.connect(":memory:")
+        escaped_path = parquet_path.replace("'", "''")
+        duck.execute(f"CREATE VIEW ipl_data AS SELECT * FROM read_parquet('{escaped_path}')")
+        # Rollups are small, so materialize them as in-memory tables
+        for name, (select_sql, _) in ROLLUP_VIEWS.items():
+            duck.execute(f"CREATE TABLE {name} AS {select_sql}")
+        return duck
+    
+    def export_parquet(self, parquet_path: str):
+        """Write a Parquet snapshot of ipl_data from Postgres for the DuckDB engine"""
+        import duckdb
+        
+        escaped_url = self.database_url.replace("'", "''")
+        escaped_path = parquet_path.replace("'", "''")
+        with duckdb.connect(":memory:") as duck:
+            duck.execute("INSTALL postgres")
+            duck.execute("LOAD postgres")
+            duck.execute(f"ATTACH '{escaped_url}' AS pg (TYPE postgres, READ_ONLY)")
+            duck.execute(f"COPY (SELECT * FROM pg.public.ipl_data) TO '{escaped_path}' (FORMAT parquet)")
     
     @contextmanager
     def get_connection(self):
-        conn = None
+        conn = self._pool.getconn()
+        broken = False
         try:
-            conn = psycopg2.connect(self.database_url)
+            # Every statement here stands alone, so skip the BEGIN/ROLLBACK round
+            # trips psycopg2 would otherwise wrap around each one
+            if not conn.autocommit:
+                conn.autocommit = True
             yield conn
         except Exception as e:
-            st.error(f"Database connection error: {e}")
-            if conn:
-                conn.rollback()
+            # Logged rather than shown: this also runs on worker and refresh
+            # threads, which have no Streamlit script context. Callers report
+            # the error to the user
+            logger.error(f"Database connection error: {e}")
+            broken = True
+            # A connection the server already dropped can't roll back; don't
+            # let that mask the original error
+            if not conn.closed:
+                try:
+                    conn.rollback()
+                except Exception:
+                    pass
             raise
         finally:
-            if conn:
-                conn.close()
+            # Don't hand a possibly broken connection back to other queries,
+            # but always give the slot back to the pool
+            self._pool.putconn(conn, close=broken)
+    
+    def close(self):
+        """Close all pooled connections"""
+        self._pool.closeall()
+    
+    def ensure_indexes(self):
+        """Create the hot-path indexes if they don't exist yet"""
+        self._run_ddl(INDEX_DDL)
+    
+    def ensure_rollups(self) -> bool:
+        """Create the pre-aggregated rollup views if they don't exist yet.
+        Returns True only if every view is actually there afterwards."""
+        self._run_ddl(ROLLUP_DDL)
+        with self.get_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT matviewname FROM pg_matviews WHERE matviewname = ANY(%s)", (list(ROLLUP_VIEWS),))
+                existing = {row[0] for row in cursor.fetchall()}
+        self.has_rollups = existing == set(ROLLUP_VIEWS)
+        if not self.has_rollups:
+            logger.warning(f"Rollup views missing ({', '.join(sorted(set(ROLLUP_VIEWS) - existing))}); querying ipl_data directly")
+        return self.has_rollups
+    
+    def refresh_rollups(self):
+        """Rebuild the rollup views from the current contents of ipl_data"""
+        self._run_ddl(tuple(f"REFRESH MATERIALIZED VIEW CONCURRENTLY {name}" for name in ROLLUP_VIEWS))
+    
+    def start_rollup_refresh(self, interval: float):
+        """Refresh the rollups every interval seconds on a daemon thread. The
+        first refresh waits a full interval, since the views were just ensured"""
+        def refresh_loop():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.refresh_rollups()
+                except Exception as e:
+                    logger.warning(f"Rollup refresh failed: {e}")
+        
+        threading.Thread(target=refresh_loop, name="rollup-refresh", daemon=True).start()
+    
+    def _run_ddl(self, statements):
+        with self.get_connection() as conn:
+            for statement in statements:
+                try:
+                    with conn.cursor() as cursor:
+                        cursor.execute(statement)
+                    conn.commit()
+                except Exception as e:
+                    # Missing privileges shouldn't stop the app from starting
+                    conn.rollback()
+                    logger.warning(f"Could not run '{statement}': {e}")
     
     def execute_query(self, query: str, params: tuple = None) -> Dict[str, Any]:
         """Execute query and return result with metadata"""
+        if self._duck is not None:
+            return self._execute_duckdb(query, params)
+        
+        try:
+            frame = self.execute_copy(query, params)
+        except Exception as e:
+            return {
+                "success": False,
+                "error": str(e),
+                "query": query
+            }
+        
+        if frame.columns.empty:
+            return {
+                "success": True,
+                "frame": frame,
+                "row_count": 0,
+                "message": "Query executed successfully, no data returned"
+            }
+        
+        # Rounding already happened in SQL (see round_projections)
+        return {
+            "success": True,
+            "frame": frame,
+            "row_count": len(frame),
+            "columns": list(frame.columns)
+        }
+    
+    def execute_copy(self, query: str, params: tuple = None) -> pd.DataFrame:
+        """Fetch a SELECT through COPY ... TO STDOUT and parse it with pandas' C reader"""
+        buffer = io.StringIO()
         with self.get_connection() as conn:
-            cursor = conn.cursor()
-            try:
-                cursor.execute(query, params)
-                
-                if cursor.description:
-                    columns = [desc[0] for desc in cursor.description]
-                    rows = cursor.fetchall()
-                    
-                    result_data = []
-                    for row in rows:
-                        row_dict = dict(zip(columns, row))
-                        # Round decimal values
-                        for key, value in row_dict.items():
-                            if isinstance(value, Decimal):
-                                row_dict[key] = round(float(value), 2)
-                            elif isinstance(value, float):
-                                row_dict[key] = round(value, 2)
-                        result_data.append(row_dict)
-                    
-                    return {
-                        "success": True,
-                        "data": result_data,
-                        "row_count": len(result_data),
-                        "columns": columns
-                    }
-                else:
+            with conn.cursor() as cursor:
+                sql = cursor.mogrify(query, params).decode() if params else query
+                # CSV carries no types, so take the column names and types from
+                # an empty run of the same query
+                cursor.execute(f"SELECT * FROM ({sql}) AS copy_source LIMIT 0")
+                description = cursor.description
+                # COPY streams the whole result in one protocol pass instead of
+                # building a Python tuple per row
+                cursor.copy_expert(f"COPY ({sql}) TO STDOUT WITH (FORMAT csv, NULL '{COPY_NULL}')", buffer)
+        
+        buffer.seek(0)
+        positions = list(range(len(description)))
+        frame = pd.read_csv(
+            buffer,
+            header=None,
+            names=positions,
+            dtype={i: COPY_DTYPES.get(column.type_code, str) for i, column in zip(positions, description)},
+            # Only the explicit marker is NULL; "", "NA" or "null" stay text
+            keep_default_na=False,
+            na_values=[COPY_NULL],
+            true_values=["t"],
+            false_values=["f"]
+        )
+        frame.columns = [column.name for column in description]
+        return frame
+    
+    def _execute_duckdb(self, query: str, params: tuple = None) -> Dict[str, Any]:
+        try:
+            # A cursor per call gives each Streamlit thread its own DuckDB connection
+            with self._duck.cursor() as cursor:
+                cursor.execute(query, list(params) if params else None)
+                if cursor.description is None:
                     return {
                         "success": True,
-                        "data": [],
+                        "frame": pd.DataFrame(),
                         "row_count": 0,
                         "message": "Query executed successfully, no data returned"
                     }
-                    
-            except Exception as e:
-                return {
-                    "success": False,
-                    "error": str(e),
-                    "query": query
-                }
+                frame = cursor.fetchdf()
+            
+            return {
+                "success": True,
+                "frame": frame,
+                "row_count": len(frame),
+                "columns": list(frame.columns)
+            }
+        except Exception as e:
+            return {
+                "success": False,
+                "error": str(e),
+                "query": query
+            }
 
-# Simplified Cricket Query Agent (without complex tool calling)
-class SimpleCricketAgent:
-    def __init__(self, groq_api_key: str, db_manager: DatabaseManager):
-        self.client = Groq(api_key=groq_api_key)
-        self.db_manager = db_manager
+# Result-set cache for generated SQL. Queries that depend on the clock or
+# randomness are always sent to the database.
+_VOLATILE_SQL_RE = re.compile(r"\b(?:now\s*\(|current_(?:date|time|timestamp)\b|random\s*\()", re.IGNORECASE)
 
-    def chat(self, user_query: str) -> Dict[str, Any]:
-        """Simple chat function that generates SQL and executes it"""
+class _UncachedResult(Exception):
+    """Carries a failed query result out of the cached runner so it isn't stored"""
+    def __init__(self, result: Dict[str, Any]):
+        super().__init__(result.get("error"))
+        self.result = result
+
+@st.cache_data(ttl=3600, show_spinner=False, max_entries=256)
+def _run_sql_cached(_db_manager: DatabaseManager, database_url: str, cache_key: str, _query: str) -> Dict[str, Any]:
+    result = _db_manager.execute_query(_query)
+    if not result["success"]:
+        raise _UncachedResult(result)
+    return result
+
+def run_sql(db_manager: DatabaseManager, query: str) -> Dict[str, Any]:
+    """Execute a query, reusing cached results for identical SQL"""
+    if _VOLATILE_SQL_RE.search(query):
+        return db_manager.execute_query(query)
+    # Whitespace is collapsed for the cache key only; the query runs as
+    # written, since spaces inside string literals are significant
+    cache_key = " ".join(query.split())
+    try:
+        return _run_sql_cached(db_manager, db_manager.database_url, cache_key, query)
+    except _UncachedResult as e:
+        return e.result
+
+# Generated SQL is parsed once: fenced code is unwrapped, anything that isn't
+# a read-only query is rejected, and a row cap is added when missing
+MAX_RESULT_ROWS = 10000
+_WRITE_NODES = (exp.Insert, exp.Update, exp.Delete, exp.Merge, exp.Into)
+_SQL_FENCE_RE = re.compile(r"```(?:sql)?\s*(.*?)```", re.DOTALL | re.IGNORECASE)
+
+def prepare_sql(llm_output: str) -> str:
+    """Extract, validate and canonicalize the SQL returned by the LLM"""
+    fenced = _SQL_FENCE_RE.search(llm_output)
+    sql_text = fenced.group(1) if fenced else llm_output
+    
+    tree = sqlglot.parse_one(sql_text, read="postgres")
+    if not isinstance(tree, exp.Query):
+        raise ValueError(f"Only SELECT queries are allowed, got {tree.key.upper()}")
+    # A SELECT can still write: data-modifying CTEs and SELECT ... INTO
+    writer = tree.find(*_WRITE_NODES)
+    if writer is not None:
+        raise ValueError(f"Only read-only queries are allowed, got {writer.key.upper()}")
+    if not tree.args.get("limit"):
+        tree = tree.limit(MAX_RESULT_ROWS)
+    round_projections(tree)
+    
+    # Canonical text also keeps the result cache key stable across whitespace/casing
+    return tree.sql(dialect="postgres")
+
+# Projections that produce fractional values: only a top-level division or
+# average is rounded. CASE labels, date arithmetic and integer sums are left
+# alone, since casting them to numeric would fail or change their type.
+_FRACTIONAL_NODES = (exp.Div, exp.Avg)
+_TEMPORAL_NODES = (exp.Interval, exp.CurrentDate, exp.CurrentTimestamp, exp.DateTrunc, exp.TimestampTrunc)
+_DATE_COLUMNS = {"date"}
+
+def _is_temporal(value: exp.Expression) -> bool:
+    """True if the expression works on dates/intervals (counting dates is fine)"""
+    for node in value.find_all(exp.Column, *_TEMPORAL_NODES):
+        if not isinstance(node, exp.Column):
+            return True
+        if node.name.lower() in _DATE_COLUMNS and not node.find_ancestor(exp.Count):
+            return True
+    return False
+
+def round_projections(tree: exp.Expression) -> exp.Expression:
+    """Wrap ratio/average SELECT columns in ROUND(x::numeric, 2)::float8 so
+    Postgres does the rounding and returns plain doubles instead of NUMERIC text"""
+    if not isinstance(tree, exp.Select):
+        return tree
+    
+    projections = []
+    for projection in tree.expressions:
+        value = projection.this if isinstance(projection, exp.Alias) else projection
+        if not isinstance(value.unnest(), _FRACTIONAL_NODES) or _is_temporal(value):
+            projections.append(projection)
+            continue
         
-        try:
-            # Generate SQL using Groq
-            system_prompt = """You are an expert cricket analyst. Generate ONLY a valid PostgreSQL query for the IPL cricket database.
+        rounded = exp.cast(
+            exp.Round(this=exp.cast(value.copy(), "numeric"), decimals=exp.Literal.number(2)),
+            "double precision"
+        )
+        # Keep the column name Postgres would have given the unwrapped expression
+        if isinstance(projection, exp.Alias):
+            alias = projection.args["alias"].copy()
+        elif isinstance(value, exp.Func):
+            alias = exp.to_identifier(value.sql_name().lower(), quoted=True)
+        else:
+            alias = exp.to_identifier("?column?", quoted=True)
+        projections.append(exp.alias_(rounded, alias))
+    
+    tree.set("expressions", projections)
+    return tree
+
+PREVIEW_ROWS = 20
+
+def limit_sql(sql: str, limit: int) -> Optional[str]:
+    """Return the query capped at limit rows, or None if it already returns no more"""
+    tree = sqlglot.parse_one(sql, read="postgres")
+    current = tree.args.get("limit")
+    if current is not None and current.expression.name.isdigit() and int(current.expression.name) <= limit:
+        return None
+    return tree.limit(limit).sql(dialect="postgres")
+
+# LLM settings shared by the agent and the cached completion helpers
+LLM_MODEL = "llama-3.1-8b-instant"
+
+SQL_PROMPT_SCHEMA = """You are an expert cricket analyst. Generate ONLY a valid PostgreSQL query for the IPL cricket database.
 
 Database Schema:
 - Table: ipl_data
@@ -162,7 +501,22 @@ Match Phases:
 - Middle overs: over_col BETWEEN 7 AND 15
 - Death overs: over_col BETWEEN 16 AND 20
 
-Guidelines:
+"""
+
+# Only added to the prompt when the views exist in the database
+ROLLUP_PROMPT = """Pre-aggregated views (PREFER these over ipl_data when they cover the question):
+- mv_batter_vs_type: batter_full_name, bowling_type, phase, runs, balls, outs, fours, sixes
+- mv_bowler_vs_hand: bowler_full_name, bat_hand, phase, runs, balls, wickets
+- mv_batter_season: batter_full_name, season, matches, runs, balls, outs, fours, sixes
+- mv_bowler_season: bowler_full_name, season, matches, runs, balls, wickets
+- Use the *_season views for per-season or season-range questions without a phase or matchup filter
+- phase is 'PP' (overs 1-6), 'MID' (overs 7-15) or 'DEATH' (overs 16+); omit the phase filter for whole-innings stats
+- Always SUM the columns and GROUP BY the player, e.g. batting average = SUM(runs) * 1.0 / NULLIF(SUM(outs), 0), strike rate = SUM(runs) * 100.0 / NULLIF(SUM(balls), 0), economy = SUM(runs) * 6.0 / NULLIF(SUM(balls), 0)
+- Use ipl_data only for columns the views don't have (venue, teams, dates, or season combined with phase/matchup)
+
+"""
+
+SQL_PROMPT_GUIDELINES = """Guidelines:
 - Use ILIKE '%name%' for player name searches
 - Add HAVING clauses for minimum thresholds (e.g., >= 500 runs or >= 100 balls)
 - Use NULLIF to avoid division by zero
@@ -170,51 +524,182 @@ Guidelines:
 
 Generate ONLY the SQL query, no explanations."""
 
-            response = self.client.chat.completions.create(
-                model="llama-3.1-8b-instant",
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_query}
-                ],
-                temperature=0.1,
-                max_tokens=300
-            )
-            
-            sql_query = response.choices[0].message.content.strip()
-            
-            # Clean up the SQL query
-            if "```sql" in sql_query:
-                sql_query = sql_query.split("```sql")[1].split("```")[0]
-            elif "```" in sql_query:
-                sql_query = sql_query.split("```")[1]
+SQL_SYSTEM_PROMPT = SQL_PROMPT_SCHEMA + ROLLUP_PROMPT + SQL_PROMPT_GUIDELINES
+SQL_SYSTEM_PROMPT_NO_ROLLUPS = SQL_PROMPT_SCHEMA + SQL_PROMPT_GUIDELINES
+
+SUMMARY_SYSTEM_PROMPT = "You are a cricket commentator. Interpret the query results in a friendly, engaging way."
+
+# Only quotes and trailing ?!. are dropped; operators (<, >, =, %) and number
+# separators change the meaning of a question
+_QUOTE_RE = re.compile(r"['\"`\u2018\u2019\u201c\u201d]")
+
+def normalize_query(user_query: str) -> str:
+    """Normalize a question so trivially different phrasings share a cache entry"""
+    return " ".join(_QUOTE_RE.sub("", user_query.lower()).split()).rstrip("?!. ")
+
+# Example buttons with hand-written SQL over the rollup views; these questions
+# never change, so they skip the LLM entirely
+PACE_FILTER = "(bowling_type ILIKE '%pace%' OR bowling_type ILIKE '%fast%' OR bowling_type ILIKE '%medium%')"
+
+EXAMPLE_QUERIES = [
+    ("🏆 Best Average", "Highest batting average vs spin bowling min 500 runs", """
+        SELECT batter_full_name, SUM(runs) AS runs, SUM(balls) AS balls, SUM(outs) AS outs,
+               ROUND(SUM(runs) * 1.0 / NULLIF(SUM(outs), 0), 2) AS batting_average,
+               ROUND(SUM(runs) * 100.0 / NULLIF(SUM(balls), 0), 2) AS strike_rate
+        FROM mv_batter_vs_type
+        WHERE bowling_type ILIKE '%spin%'
+        GROUP BY batter_full_name
+        HAVING SUM(runs) >= 500
+        ORDER BY batting_average DESC NULLS LAST
+        LIMIT 20"""),
+    ("⚡ Strike Rate", "Best strike rate against pace bowling min 1000 balls", f"""
+        SELECT batter_full_name, SUM(runs) AS runs, SUM(balls) AS balls,
+               ROUND(SUM(runs) * 100.0 / NULLIF(SUM(balls), 0), 2) AS strike_rate,
+               SUM(fours) AS fours, SUM(sixes) AS sixes
+        FROM mv_batter_vs_type
+        WHERE {PACE_FILTER}
+        GROUP BY batter_full_name
+        HAVING SUM(balls) >= 1000
+        ORDER BY strike_rate DESC
+        LIMIT 20"""),
+    ("🎯 Kohli vs Spin", "Virat Kohli average and strike rate vs spin", """
+        SELECT batter_full_name, SUM(runs) AS runs, SUM(balls) AS balls, SUM(outs) AS outs,
+               ROUND(SUM(runs) * 1.0 / NULLIF(SUM(outs), 0), 2) AS batting_average,
+               ROUND(SUM(runs) * 100.0 / NULLIF(SUM(balls), 0), 2) AS strike_rate
+        FROM mv_batter_vs_type
+        WHERE batter_full_name ILIKE '%virat kohli%' AND bowling_type ILIKE '%spin%'
+        GROUP BY batter_full_name"""),
+    ("🏹 Bowling Stats", "Best bowling average and strike rate vs left handed batsmen", """
+        SELECT bowler_full_name, SUM(runs) AS runs_conceded, SUM(balls) AS balls, SUM(wickets) AS wickets,
+               ROUND(SUM(runs) * 1.0 / NULLIF(SUM(wickets), 0), 2) AS bowling_average,
+               ROUND(SUM(balls) * 1.0 / NULLIF(SUM(wickets), 0), 2) AS bowling_strike_rate
+        FROM mv_bowler_vs_hand
+        WHERE bat_hand = 'LHB'
+        GROUP BY bowler_full_name
+        HAVING SUM(balls) >= 300
+        ORDER BY bowling_average ASC NULLS LAST
+        LIMIT 20"""),
+]
+
+def inline_rollups(sql: str) -> str:
+    """Replace rollup view references with their defining SELECT, for databases without the views"""
+    for name, (select_sql, _) in ROLLUP_VIEWS.items():
+        sql = re.sub(rf"\b{name}\b", lambda _: f"({select_sql}) AS {name}", sql)
+    return sql
+
+EXAMPLE_SQL = {normalize_query(query): sql for _, query, sql in EXAMPLE_QUERIES}
+EXAMPLE_SQL_NO_ROLLUPS = {normalized: inline_rollups(sql) for normalized, sql in EXAMPLE_SQL.items()}
+
+# Cached LLM calls. Arguments starting with "_" are not part of the cache key,
+# so the original question is sent to Groq but the normalized one is the key.
+@st.cache_data(ttl=24 * 60 * 60, show_spinner=False, max_entries=512)
+def generate_sql_completion(_client: Groq, model: str, system_prompt: str, normalized_query: str, _user_query: str) -> str:
+    """Ask Groq for a SQL query, cached on (model, system prompt, normalized question).
+
+    Returns the prepare_sql output. A reply it rejects raises before anything
+    is cached, so the next identical question asks Groq again.
+    """
+    response = _client.chat.completions.create(
+        model=model,
+        messages=[
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": _user_query}
+        ],
+        temperature=0.1,
+        max_tokens=300
+    )
+    return prepare_sql(response.choices[0].message.content.strip())
+
+@st.cache_data(ttl=24 * 60 * 60, show_spinner=False, max_entries=512)
+def generate_summary_completion(_client: Groq, model: str, normalized_query: str, results_preview: str, _user_query: str,
+                                _on_token: Optional[Callable[[str], None]] = None) -> str:
+    """Ask Groq for a commentary on the results, cached on (model, normalized question, results).
+
+    The completion is streamed; each token is passed to _on_token as it arrives.
+    Cache hits return the full text without calling _on_token.
+    """
+    stream = _client.chat.completions.create(
+        model=model,
+        messages=[
+            {"role": "system", "content": SUMMARY_SYSTEM_PROMPT},
+            {"role": "user", "content": f"User asked: {_user_query}\n\nResults: {results_preview}\n\nProvide a brief, engaging summary."}
+        ],
+        temperature=0.3,
+        max_tokens=200,
+        stream=True
+    )
+    parts = []
+    for chunk in stream:
+        token = chunk.choices[0].delta.content
+        if token:
+            parts.append(token)
+            if _on_token:
+                _on_token(token)
+    return "".join(parts)
+
+# Simplified Cricket Query Agent (without complex tool calling)
+class SimpleCricketAgent:
+    def __init__(self, client: Groq, db_manager: DatabaseManager):
+        self.client = client
+        self.db_manager = db_manager
+        # Only point the LLM and the examples at the rollups if they were created
+        if db_manager.has_rollups:
+            self.sql_prompt, self.example_sql = SQL_SYSTEM_PROMPT, EXAMPLE_SQL
+        else:
+            self.sql_prompt, self.example_sql = SQL_SYSTEM_PROMPT_NO_ROLLUPS, EXAMPLE_SQL_NO_ROLLUPS
+        # Runs the commentary call while the caller renders the data
+        self._executor = ThreadPoolExecutor(max_workers=4)
+
+    def chat(self, user_query: str) -> Dict[str, Any]:
+        """Simple chat function that generates SQL and executes it"""
+        return self.finish_chat(self.start_chat(user_query))
+
+    def start_chat(self, user_query: str, on_token: Optional[Callable[[str], None]] = None) -> Dict[str, Any]:
+        """Generate and execute SQL; the summary is left running in the background"""
+        
+        try:
+            normalized_query = normalize_query(user_query)
             
-            sql_query = sql_query.strip()
+            # Generate SQL using Groq, unless it's one of the fixed examples;
+            # either way it comes back cleaned up and validated
+            example_sql = self.example_sql.get(normalized_query)
+            if example_sql:
+                sql_query = prepare_sql(example_sql)
+            else:
+                sql_query = generate_sql_completion(
+                    self.client, LLM_MODEL, self.sql_prompt, normalized_query, user_query
+                )
             
-            # Execute the query
-            result = self.db_manager.execute_query(sql_query)
+            # Execute a capped preview first so the first paint and the summary
+            # don't wait on the full result set
+            preview_query = limit_sql(sql_query, PREVIEW_ROWS)
+            result = run_sql(self.db_manager, preview_query or sql_query)
             
-            if result["success"] and result["data"]:
+            if result["success"] and result["row_count"]:
+                # Only fetch the rest if the preview was actually cut off
+                full_future = None
+                if preview_query and result["row_count"] >= PREVIEW_ROWS:
+                    full_future = self._executor.submit(run_sql, self.db_manager, sql_query)
+                
                 # Generate natural language response
-                nl_response = self.client.chat.completions.create(
-                    model="llama-3.1-8b-instant",
-                    messages=[
-                        {"role": "system", "content": "You are a cricket commentator. Interpret the query results in a friendly, engaging way."},
-                        {"role": "user", "content": f"User asked: {user_query}\n\nResults: {result['data'][:5]}\n\nProvide a brief, engaging summary."}
-                    ],
-                    temperature=0.3,
-                    max_tokens=200
+                preview = result["frame"].head(5).to_dict("records")
+                summary_future = self._executor.submit(
+                    generate_summary_completion,
+                    self.client, LLM_MODEL, normalized_query, str(preview), user_query, on_token
                 )
                 
                 return {
-                    "response": nl_response.choices[0].message.content,
-                    "data": result["data"],
+                    "response": None,
+                    "summary_future": summary_future,
+                    "full_future": full_future,
+                    "frame": result["frame"],
                     "sql_query": sql_query,
                     "success": True
                 }
             else:
                 return {
                     "response": f"Query executed but no data found. Error: {result.get('error', 'Unknown error')}",
-                    "data": [],
+                    "frame": None,
                     "sql_query": sql_query,
                     "success": False,
                     "error": result.get('error', 'No data found')
@@ -223,15 +708,59 @@ Generate ONLY the SQL query, no explanations."""
         except Exception as e:
             return {
                 "response": f"I encountered an error while processing your question: {str(e)}",
-                "data": [],
+                "frame": None,
                 "sql_query": None,
                 "success": False,
                 "error": str(e)
             }
 
-# Initialize session state
+    @staticmethod
+    def finish_chat(result: Dict[str, Any]) -> Dict[str, Any]:
+        """Wait for the background summary and full result and fold them into the result"""
+        summary_future = result.pop("summary_future", None)
+        if summary_future is not None:
+            try:
+                result["response"] = summary_future.result()
+            except Exception as e:
+                # The data is still worth showing without the commentary
+                logger.warning(f"Summary generation failed: {e}")
+                result["response"] = "Here are your results:"
+        
+        full_future = result.pop("full_future", None)
+        if full_future is not None:
+            full_result = full_future.result()
+            if full_result["success"]:
+                result["frame"] = full_result["frame"]
+            else:
+                logger.warning(f"Full result fetch failed, keeping preview: {full_result.get('error')}")
+        return result
+
+# Initialize session state. Bot messages hold their result frames, so the
+# history is bounded; only the last few are ever shown anyway
+MAX_CHAT_MESSAGES = 200
+
 if 'messages' not in st.session_state:
-    st.session_state.messages = []
+    st.session_state.messages = deque(maxlen=MAX_CHAT_MESSAGES)
+
+# Long-lived resources: one pool and one Groq client per process, shared by
+# every session and rerun. Query results are cached separately in run_sql.
+@st.cache_resource(show_spinner=False)
+def get_database_manager(database_url: str, parquet_path: Optional[str] = None) -> DatabaseManager:
+    db_manager = DatabaseManager(database_url, parquet_path=parquet_path)
+    if not parquet_path:
+        db_manager.ensure_indexes()
+        if db_manager.ensure_rollups() and ROLLUP_REFRESH_SECONDS > 0:
+            db_manager.start_rollup_refresh(ROLLUP_REFRESH_SECONDS)
+    return db_manager
+
+@st.cache_resource(show_spinner=False)
+def get_groq_client(groq_api_key: str) -> Groq:
+    # Keep-alive HTTP/2 connections so successive completions skip the TLS handshake
+    http_client = httpx.Client(
+        http2=True,
+        limits=httpx.Limits(max_keepalive_connections=20, keepalive_expiry=60)
+    )
+    return Groq(api_key=groq_api_key, http_client=http_client)
 
 # Initialize connections
 @st.cache_resource(show_spinner="🔄 Connecting to database and AI...")
@@ -240,10 +769,12 @@ def initialize_connections():
         # Try Streamlit secrets first
         database_url = st.secrets["DATABASE_URL"]
         groq_api_key = st.secrets["GROQ_API_KEY"]
+        parquet_path = st.secrets.get("IPL_PARQUET_PATH")
     except (KeyError, AttributeError):
         # Fallback to environment variables
         database_url = os.getenv("DATABASE_URL")
         groq_api_key = os.getenv("GROQ_API_KEY")
+        parquet_path = os.getenv("IPL_PARQUET_PATH")
         
         if not database_url or not groq_api_key:
             st.error("Please set DATABASE_URL and GROQ_API_KEY in Streamlit secrets or environment variables")
@@ -251,7 +782,7 @@ def initialize_connections():
     
     try:
         # Initialize database
-        db_manager = DatabaseManager(database_url)
+        db_manager = get_database_manager(database_url, parquet_path)
         
         # Test connection
         test_result = db_manager.execute_query("SELECT COUNT(*) as total_records FROM ipl_data LIMIT 1")
@@ -259,10 +790,10 @@ def initialize_connections():
             st.error(f"Database connection failed: {test_result['error']}")
             st.stop()
             
-        total_records = test_result["data"][0]["total_records"]
+        total_records = int(test_result["frame"]["total_records"].iloc[0])
         
         # Initialize cricket agent
-        cricket_agent = SimpleCricketAgent(groq_api_key, db_manager)
+        cricket_agent = SimpleCricketAgent(get_groq_client(groq_api_key), db_manager)
         
         return db_manager, cricket_agent, total_records
         
@@ -273,22 +804,98 @@ def initialize_connections():
 def process_query(query: str, cricket_agent):
     """Process user query and add to session state"""
     # Add user message
-    st.session_state.messages.append({
+    user_message = {
         "role": "user",
         "content": query,
         "timestamp": datetime.now()
-    })
+    }
+    user_message["html_blob"] = render_message_html(user_message)
+    st.session_state.messages.append(user_message)
     
     # Process with AI agent
     with st.spinner("🤖 Analyzing your cricket query with AI..."):
-        result = cricket_agent.chat(query)
+        tokens = queue.Queue()
+        result = cricket_agent.start_chat(query, on_token=tokens.put)
+        summary_future = result.get("summary_future")
+        if summary_future is not None:
+            # Show the table right away and stream the commentary in as it's written
+            st.dataframe(result["frame"], use_container_width=True, hide_index=True)
+            placeholder = st.empty()
+            streamed = ""
+            while not (summary_future.done() and tokens.empty()):
+                try:
+                    streamed += tokens.get(timeout=0.05)
+                except queue.Empty:
+                    continue
+                placeholder.markdown(streamed)
+        result = cricket_agent.finish_chat(result)
+    
+    # Encode the download once here instead of on every rerun of the history
+    if result.get("frame") is not None and not result["frame"].empty:
+        result["csv"] = result["frame"].to_csv(index=False).encode()
     
     # Add bot response
-    st.session_state.messages.append({
+    bot_message = {
         "role": "assistant",
         "content": result,
         "timestamp": datetime.now()
-    })
+    }
+    bot_message["html_blob"] = render_message_html(bot_message)
+    st.session_state.messages.append(bot_message)
+
+def render_message_html(message: Dict[str, Any]) -> Optional[str]:
+    """Build a message's chat bubble once, when it's appended to the history"""
+    timestamp_str = message['timestamp'].strftime("%H:%M:%S")
+    
+    if message["role"] == "user":
+        return f"""
+        <div class="chat-message-user">
+            <strong>You ({timestamp_str}):</strong><br>
+            {message['content']}
+        </div>
+        """
+    
+    result = message['content']
+    if not result.get('success', True):
+        return None
+    return f"""
+    <div class="chat-message-bot">
+        <strong>🤖 Cricket AI ({timestamp_str}):</strong><br>
+        {result.get('response', 'Here are your results:')}
+    </div>
+    """
+
+def render_result_widgets(result: Dict[str, Any], key: str):
+    """Table, CSV download and SQL toggle for one bot result"""
+    df = result.get('frame')
+    if df is None or df.empty:
+        return
+    
+    # Display table
+    st.dataframe(
+        df,
+        use_container_width=True,
+        hide_index=True,
+    )
+    
+    # Download and SQL query in columns
+    col1, col2 = st.columns([1, 1])
+    
+    with col1:
+        # Download button
+        st.download_button(
+            label="📥 Download CSV",
+            data=result['csv'],
+            file_name=f"cricket_data_{int(time.time())}.csv",
+            mime="text/csv",
+            key=f"download_{key}"
+        )
+    
+    with col2:
+        # SQL Query toggle
+        if result.get('sql_query'):
+            if st.button(f"🔍 Show SQL", key=f"sql_{key}"):
+                st.code(result['sql_query'], language='sql')
 
 # Main app
 def main():
@@ -319,21 +926,14 @@ def main():
         # Clear chat
         if st.session_state.messages:
             if st.button("🗑️ Clear Chat History", type="secondary"):
-                st.session_state.messages = []
+                st.session_state.messages.clear()
                 st.rerun()
     
     # Example queries
     st.header("💡 Example Queries")
     col1, col2, col3, col4 = st.columns(4)
     
-    examples = [
-        ("🏆 Best Average", "Highest batting average vs spin bowling min 500 runs"),
-        ("⚡ Strike Rate", "Best strike rate against pace bowling min 1000 balls"),
-        ("🎯 Kohli vs Spin", "Virat Kohli average and strike rate vs spin"),
-        ("🏹 Bowling Stats", "Best bowling average and strike rate vs left handed batsmen")
-    ]
-    
-    for i, (title, query) in enumerate(examples):
+    for i, (title, query, _) in enumerate(EXAMPLE_QUERIES):
         col = [col1, col2, col3, col4][i]
         with col:
             if st.button(title, use_container_width=True, key=f"example_{i}"):
@@ -356,61 +956,32 @@ def main():
     if st.session_state.messages:
         st.header("💬 Chat History")
         
-        for message in reversed(st.session_state.messages[-10:]):  # Show last 10
-            timestamp_str = message['timestamp'].strftime("%H:%M:%S")
-            
+        # Only the newest answer gets live widgets; older ones are a cached
+        # bubble plus a toggle, so reruns don't rebuild every table
+        recent = list(islice(reversed(st.session_state.messages), 10))  # Show last 10, newest first
+        newest_bot = next((m for m in recent if m["role"] == "assistant"), None)
+        
+        for message in recent:
             if message["role"] == "user":
-                st.markdown(f"""
-                <div class="chat-message-user">
-                    <strong>You ({timestamp_str}):</strong><br>
-                    {message['content']}
-                </div>
-                """, unsafe_allow_html=True)
+                st.markdown(message["html_blob"], unsafe_allow_html=True)
             
             else:
                 result = message['content']
                 
                 if not result.get('success', True):
+                    timestamp_str = message['timestamp'].strftime("%H:%M:%S")
                     st.error(f"❌ **Error ({timestamp_str}):** {result.get('error', 'Unknown error')}")
                 else:
                     # Bot response
-                    st.markdown(f"""
-                    <div class="chat-message-bot">
-                        <strong>🤖 Cricket AI ({timestamp_str}):</strong><br>
-                        {result.get('response', 'Here are your results:')}
-                    </div>
-                    """, unsafe_allow_html=True)
+                    st.markdown(message["html_blob"], unsafe_allow_html=True)
                     
                     # Data display
-                    if result.get('data'):
-                        df = pd.DataFrame(result['data'])
-                        
-                        # Display table
-                        st.dataframe(
-                            df,
-                            use_container_width=True,
-                            hide_index=True,
-                        )
-                        
-                        # Download and SQL query in columns
-                        col1, col2 = st.columns([1, 1])
-                        
-                        with col1:
-                            # Download button
-                            csv = df.to_csv(index=False)
-                            st.download_button(
-                                label="📥 Download CSV",
-                                data=csv,
-                                file_name=f"cricket_data_{int(time.time())}.csv",
-                                mime="text/csv",
-                                key=f"download_{message['timestamp']}"
-                            )
-                        
-                        with col2:
-                            # SQL Query toggle
-                            if result.get('sql_query'):
-                                if st.button(f"🔍 Show SQL", key=f"sql_{message['timestamp']}"):
-                                    st.code(result['sql_query'], language='sql')
+                    key = str(message['timestamp'])
+                    if message is newest_bot:
+                        render_result_widgets(result, key)
+                    elif result.get('frame') is not None and not result['frame'].empty:
+                        if st.toggle("Previous result", key=f"show_{key}"):
+                            render_result_widgets(result, key)
             
             st.divider()
 
@@ -1,70 +1,191 @@
 import psycopg2
-import os
-from typing import List, Dict, Any
+from psycopg2 import pool
+import re
+import hashlib
+import threading
+from typing import List, Dict, Any, Optional
 import logging
 from contextlib import contextmanager
+from cachetools import TTLCache
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Parse NUMERIC and float columns straight into floats rounded to 2 places,
+# so result rows never need a separate Decimal/rounding pass. Registered only
+# on the cursors of queries that ask for it, never process-wide
+ROUNDED_FLOAT = psycopg2.extensions.new_type(
+    psycopg2.extensions.DECIMAL.values + psycopg2.extensions.FLOAT.values,
+    "ROUNDED_FLOAT",
+    lambda value, cursor: round(float(value), 2) if value is not None else None
+)
+
+FETCH_BATCH_SIZE = 2000
+
+# Indexes for the predicates generated SQL filters on most: ILIKE name and
+# bowling-type searches (trigram GIN) plus phase/validity and wicket filters
+INDEX_DDL = (
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS ipl_batter_trgm ON ipl_data USING gin (batter_full_name gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS ipl_bowler_trgm ON ipl_data USING gin (bowler_full_name gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS ipl_bowling_type_trgm ON ipl_data USING gin (bowling_type gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS ipl_phase ON ipl_data (over_col) WHERE valid_ball = 1",
+    "CREATE INDEX IF NOT EXISTS ipl_wicket ON ipl_data (bowler_full_name) WHERE is_wicket = true",
+)
+
+# Queries whose results depend on the clock or randomness are never cached
+VOLATILE_SQL_RE = re.compile(r"\b(?:now\s*\(|current_(?:date|time|timestamp)\b|random\s*\()", re.IGNORECASE)
+
 class DatabaseManager:
-    def __init__(self, database_url: str):
+    def __init__(self, database_url: str, minconn: int = 2, maxconn: int = 16,
+                 cache_size: int = 256, cache_ttl: int = 3600):
         self.database_url = database_url
+        # Shared across requests so /chat, /players etc. don't reconnect every time
+        self._pool = pool.ThreadedConnectionPool(minconn=minconn, maxconn=maxconn, dsn=database_url)
+        # Result sets keyed by normalized SQL; ipl_data only changes on ingest
+        self._result_cache = TTLCache(maxsize=cache_size, ttl=cache_ttl)
+        self._cache_lock = threading.Lock()
+        # The player list is near-static, so it is loaded once per process
+        self._players = None
     
     @contextmanager
     def get_connection(self):
-        conn = None
+        conn = self._pool.getconn()
+        broken = False
         try:
-            conn = psycopg2.connect(self.database_url)
             yield conn
         except Exception as e:
             logger.error(f"Database connection error: {e}")
-            if conn:
-                conn.rollback()
+            broken = True
+            # A connection the server already dropped (restart, idle timeout)
+            # can't roll back; don't let that mask the original error
+            if not conn.closed:
+                try:
+                    conn.rollback()
+                except psycopg2.Error:
+                    pass
             raise
         finally:
-            if conn:
-                conn.close()
+            # Drop a failed connection rather than returning it in an unknown
+            # state, but always give the slot back to the pool
+            self._pool.putconn(conn, close=broken)
+    
+    def close(self):
+        """Close all pooled connections"""
+        self._pool.closeall()
     
-    def execute_query(self, query: str, params: tuple = None) -> List[Dict[str, Any]]:
-        """Execute a query and return results as list of dictionaries"""
+    def ensure_indexes(self):
+        """Create the hot-path indexes if they don't exist yet"""
         with self.get_connection() as conn:
-            cursor = conn.cursor()
-            try:
-                cursor.execute(query, params)
-                
-                # Get column names
-                if cursor.description:
-                    columns = [desc[0] for desc in cursor.description]
-                    rows = cursor.fetchall()
-                    
-                    # Convert to list of dictionaries
-                    result = []
-                    for row in rows:
-                        result.append(dict(zip(columns, row)))
-                    
-                    return result
-                else:
-                    return []
+            for statement in INDEX_DDL:
+                try:
+                    with conn.cursor() as cursor:
+                        cursor.execute(statement)
+                    conn.commit()
+                except Exception as e:
+                    # Missing privileges shouldn't stop the app from starting
+                    conn.rollback()
+                    logger.warning(f"Could not run '{statement}': {e}")
+    
+    @staticmethod
+    def _cache_key(query: str, params: tuple = None, round_floats: bool = False) -> str:
+        normalized = " ".join(query.split())
+        return hashlib.blake2b(f"{normalized}|{params!r}|{round_floats}".encode()).hexdigest()
+    
+    def clear_cache(self):
+        """Drop all cached result sets"""
+        with self._cache_lock:
+            self._result_cache.clear()
+    
+    def execute_query(self, query: str, params: tuple = None, timeout: Optional[float] = None,
+                      round_floats: bool = False) -> List[Dict[str, Any]]:
+        """Execute a query and return results as list of dictionaries. With a
+        timeout (seconds), Postgres cancels the statement and TimeoutError is
+        raised; with round_floats, NUMERIC/float values come back rounded to 2 places"""
+        if VOLATILE_SQL_RE.search(query):
+            return self._execute_uncached(query, params, timeout, round_floats)
+        
+        key = self._cache_key(query, params, round_floats)
+        with self._cache_lock:
+            cached = self._result_cache.get(key)
+        if cached is None:
+            cached = self._execute_uncached(query, params, timeout, round_floats)
+            with self._cache_lock:
+                self._result_cache[key] = cached
+        
+        # Hand out copies so callers can't mutate the cached rows
+        return [dict(row) for row in cached]
+    
+    def _execute_uncached(self, query: str, params: tuple = None, timeout: Optional[float] = None,
+                          round_floats: bool = False) -> List[Dict[str, Any]]:
+        with self.get_connection() as conn:
+            if timeout is not None:
+                # Scoped to this transaction; the pool rolls it back on return.
+                # 0 would mean no limit, so round up to at least 1ms
+                with conn.cursor() as cursor:
+                    cursor.execute("SET LOCAL statement_timeout = %s", (max(1, int(timeout * 1000)),))
+            
+            # Server-side cursor so large results are streamed in batches
+            with conn.cursor(name="ipl_stream") as cursor:
+                if round_floats:
+                    psycopg2.extensions.register_type(ROUNDED_FLOAT, cursor)
+                try:
+                    cursor.itersize = FETCH_BATCH_SIZE
+                    cursor.execute(query, params)
+                    batch = cursor.fetchmany(FETCH_BATCH_SIZE)
                     
-            except Exception as e:
-                logger.error(f"Query execution error: {e}")
-                logger.error(f"Query: {query}")
-                raise
+                    # Get column names (only available after the first fetch)
+                    if cursor.description:
+                        columns = [desc[0] for desc in cursor.description]
+                        
+                        # Convert to list of dictionaries
+                        result = []
+                        while batch:
+                            result.extend(dict(zip(columns, row)) for row in batch)
+                            batch = cursor.fetchmany(FETCH_BATCH_SIZE)
+                        
+                        return result
+                    else:
+                        return []
+                
+                except psycopg2.errors.QueryCanceled as e:
+                    raise TimeoutError(f"Query cancelled after {timeout}s") from e
+                except Exception as e:
+                    logger.error(f"Query execution error: {e}")
+                    logger.error(f"Query: {query}")
+                    raise
+    
+    def explain_query(self, query: str, params: tuple = None) -> List[str]:
+        """Plan a query without running it; raises if Postgres rejects it"""
+        with self.get_connection() as conn:
+            with conn.cursor() as cursor:
+                # Belt and braces on top of the parse check in the caller: this
+                # transaction can't write even if something slips through
+                cursor.execute("SET TRANSACTION READ ONLY")
+                cursor.execute(f"EXPLAIN {query}", params)
+                return [row[0] for row in cursor.fetchall()]
     
     def get_all_players(self) -> List[str]:
         """Get all unique player names from the database"""
+        if self._players is not None:
+            return list(self._players)
+        
+        # One scan over ipl_data, unnesting the three name columns per row
         query = """
-        SELECT DISTINCT batter_full_name FROM ipl_data WHERE batter_full_name IS NOT NULL
-        UNION
-        SELECT DISTINCT bowler_full_name FROM ipl_data WHERE bowler_full_name IS NOT NULL
-        UNION
-        SELECT DISTINCT non_striker_full_name FROM ipl_data WHERE non_striker_full_name IS NOT NULL
+        SELECT DISTINCT name
+        FROM ipl_data,
+             LATERAL unnest(ARRAY[batter_full_name, bowler_full_name, non_striker_full_name]) AS name
+        WHERE name IS NOT NULL
         ORDER BY 1
         """
         try:
-            results = self.execute_query(query)
-            return [row['batter_full_name'] for row in results if row['batter_full_name']]
+            # Single text column: plain tuples, skipping the dict rows and the
+            # result cache (the list is memoized on the manager anyway)
+            with self.get_connection() as conn:
+                with conn.cursor() as cursor:
+                    cursor.execute(query)
+                    self._players = [row[0] for row in cursor.fetchall() if row[0]]
+            return list(self._players)
         except Exception as e:
             logger.error(f"Error fetching players: {e}")
             return []
@@ -94,6 +215,23 @@ class DatabaseManager:
             logger.error(f"Error fetching venues: {e}")
             return []
     
+    def get_stats_summary(self) -> Dict[str, Any]:
+        """Get summary statistics of the database"""
+        query = """
+        SELECT 
+            COUNT(DISTINCT match_id) as total_matches,
+            COUNT(DISTINCT batter_full_name) as total_batters,
+            COUNT(DISTINCT bowler_full_name) as total_bowlers,
+            COUNT(DISTINCT venue) as total_venues,
+            COUNT(DISTINCT season) as total_seasons,
+            MIN(date) as earliest_date,
+            MAX(date) as latest_date,
+            COUNT(*) as total_balls
+        FROM ipl_data
+        """
+        results = self.execute_query(query)
+        return results[0] if results else {}
+    
     def get_schema_info(self) -> Dict[str, str]:
         """Get database schema information"""
         query = """
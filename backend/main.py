@@ -1,15 +1,19 @@
 from fastapi import FastAPI, HTTPException, Depends
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from fastapi.responses import ORJSONResponse
+from pydantic import BaseModel, Field
 from typing import List, Dict, Any, Optional
 import os
+import re
+import asyncio
 from dotenv import load_dotenv
 import logging
-from decimal import Decimal
+from cachetools import TTLCache
 
 from database import DatabaseManager
 from player_matcher import PlayerNameMatcher
-from query_generator import CricketQueryGenerator
+from query_generator import CricketQueryGenerator, prepare_sql
 
 # Load environment variables
 load_dotenv()
@@ -21,7 +25,10 @@ logger = logging.getLogger(__name__)
 app = FastAPI(
     title="IPL Cricket Chatbot API",
     description="Advanced cricket analytics chatbot with natural language query support",
-    version="1.0.0"
+    version="1.0.0",
+    # Chat and bootstrap responses carry hundreds of rows; orjson encodes
+    # them in C, without the stdlib encoder's per-object overhead
+    default_response_class=ORJSONResponse
 )
 
 # CORS middleware - Updated for production
@@ -44,6 +51,28 @@ db_manager = None
 player_matcher = None
 query_generator = None
 
+# The lookup lists only change when new matches are ingested
+bootstrap_cache = TTLCache(maxsize=1, ttl=3600)
+
+# Most rows a chat answer returns when the generated SQL sets no LIMIT itself
+MAX_CHAT_ROWS = int(os.getenv("MAX_CHAT_ROWS", "500"))
+
+# Cap concurrent Groq calls so a burst of requests doesn't trip the API rate
+# limit; the Groq client itself retries 429s with backoff
+llm_semaphore = asyncio.Semaphore(int(os.getenv("LLM_CONCURRENCY", "8")))
+
+# Database pool size. ThreadedConnectionPool fails instead of waiting when it
+# runs dry, so blocking DB calls queue on db_semaphore for a free slot first
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "16"))
+db_semaphore = asyncio.Semaphore(DB_POOL_SIZE)
+
+# Most questions a single batch request may carry
+MAX_BATCH_QUERIES = int(os.getenv("MAX_BATCH_QUERIES", "50"))
+
+# Total seconds a /chat/batch request may spend; queries still running at the
+# deadline are reported as timed out instead of holding up the whole batch
+CHAT_BATCH_BUDGET = float(os.getenv("CHAT_BATCH_BUDGET", "30"))
+
 # Pydantic models
 class ChatQuery(BaseModel):
     query: str
@@ -56,6 +85,9 @@ class ChatResponse(BaseModel):
     matched_players: Optional[List[str]] = []
     execution_time: Optional[float] = None
 
+class BatchQuery(BaseModel):
+    queries: List[str] = Field(..., max_length=MAX_BATCH_QUERIES)
+
 class PlayerSuggestion(BaseModel):
     name: str
     confidence: int
@@ -71,12 +103,18 @@ async def startup_event():
         if not database_url:
             raise ValueError("DATABASE_URL environment variable not set")
         
-        db_manager = DatabaseManager(database_url)
+        db_manager = DatabaseManager(database_url, maxconn=DB_POOL_SIZE)
+        db_manager.ensure_indexes()
         logger.info("Database connection initialized")
         
         # Initialize player matcher
         players = db_manager.get_all_players()
-        player_matcher = PlayerNameMatcher(players)
+        # PLAYER_MATCHER_CACHE (optional) reuses the built indexes across restarts
+        matcher_cache_path = os.getenv("PLAYER_MATCHER_CACHE")
+        if matcher_cache_path:
+            player_matcher = PlayerNameMatcher.load_or_build(matcher_cache_path, players)
+        else:
+            player_matcher = PlayerNameMatcher(players)
         logger.info(f"Player matcher initialized with {len(players)} players")
         
         # Initialize query generator
@@ -84,13 +122,26 @@ async def startup_event():
         if not groq_api_key:
             raise ValueError("GROQ_API_KEY environment variable not set")
         
-        query_generator = CricketQueryGenerator(groq_api_key, player_matcher)
+        # SQL_CACHE_PATH (optional) keeps generated SQL on disk across restarts
+        query_generator = CricketQueryGenerator(
+            groq_api_key,
+            player_matcher,
+            sql_cache_path=os.getenv("SQL_CACHE_PATH")
+        )
         logger.info("Query generator initialized")
         
     except Exception as e:
         logger.error(f"Startup error: {e}")
         raise
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    if db_manager is not None:
+        db_manager.close()
+        logger.info("Database connection pool closed")
+    if query_generator is not None:
+        query_generator.close()
+
 # Dependency to get database manager
 def get_db_manager() -> DatabaseManager:
     if db_manager is None:
@@ -120,38 +171,88 @@ async def chat(
 ):
     """Main chat endpoint to handle cricket queries"""
     import time
-    start_time = time.time()
+    start_ns = time.perf_counter_ns()
     
     try:
-        # Generate SQL query using Groq
-        query_result = qg.generate_sql_query(query.query)
+        # Generate SQL query using Groq. The Groq and database calls block, so
+        # run them on the threadpool instead of stalling the event loop for
+        # every other request
+        async with llm_semaphore:
+            query_result = await run_in_threadpool(qg.generate_sql_query, query.query)
         
         if not query_result.get("sql_query"):
             raise HTTPException(status_code=400, detail="Could not generate valid SQL query")
         
-        # Execute the query
-        data = db.execute_query(query_result["sql_query"])
+        # Only a single read-only query is executed, in its parsed form
+        try:
+            sql_query = prepare_sql(query_result["sql_query"], MAX_CHAT_ROWS)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"Generated SQL was rejected: {e}")
         
-        # Round decimal values to 2 decimal places
-        data = round_decimal_values(data)
+        # Execute the query (numeric values come back rounded to 2 places)
+        data = await run_db(db.execute_query, sql_query, query_result.get("params"), round_floats=True)
         
         # Generate natural language response
         response_text = generate_response_text(query.query, data, query_result.get("matched_players", []))
         
-        execution_time = time.time() - start_time
+        execution_time = (time.perf_counter_ns() - start_ns) / 1e9
         
         return ChatResponse(
             response=response_text,
             data=data,
-            sql_query=query_result["sql_query"],
+            sql_query=sql_query,
             matched_players=query_result.get("matched_players", []),
             execution_time=round(execution_time, 2)
         )
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Chat error: {e}")
         raise HTTPException(status_code=500, detail=f"Error processing query: {str(e)}")
 
+@app.post("/chat/batch", response_model=List[ChatResponse])
+async def chat_batch(
+    batch: BatchQuery,
+    db: DatabaseManager = Depends(get_db_manager),
+    qg: CricketQueryGenerator = Depends(get_query_generator)
+):
+    """Answer several cricket queries in one request, generating all the SQL in one Groq call"""
+    import time
+    start_ns = time.perf_counter_ns()
+    deadline = asyncio.get_running_loop().time() + CHAT_BATCH_BUDGET
+    
+    async def generate():
+        async with llm_semaphore:
+            # The generator stops making Groq calls at the same deadline
+            return await run_in_threadpool(
+                qg.generate_sql_queries_batch, batch.queries, time.monotonic() + CHAT_BATCH_BUDGET
+            )
+    
+    try:
+        # SQL generation (including its per-question retries) counts against
+        # the budget too
+        query_results = await asyncio.wait_for(generate(), CHAT_BATCH_BUDGET)
+        
+        # Each query runs on its own pooled connection (at most DB_POOL_SIZE
+        # at once); a failing query only fails its own entry
+        answers = await asyncio.gather(*(
+            answer_query(db, query, query_result, deadline)
+            for query, query_result in zip(batch.queries, query_results)
+        ))
+        
+        execution_time = round((time.perf_counter_ns() - start_ns) / 1e9, 2)
+        for answer in answers:
+            answer.execution_time = execution_time
+        return answers
+        
+    except asyncio.TimeoutError:
+        logger.warning(f"Batch SQL generation ran past {CHAT_BATCH_BUDGET}s")
+        raise HTTPException(status_code=504, detail="Generating SQL for the batch took too long")
+    except Exception as e:
+        logger.error(f"Batch chat error: {e}")
+        raise HTTPException(status_code=500, detail=f"Error processing queries: {str(e)}")
+
 @app.get("/players/search")
 async def search_players(
     query: str, 
@@ -170,7 +271,7 @@ async def search_players(
 async def get_all_players(db: DatabaseManager = Depends(get_db_manager)) -> List[str]:
     """Get all players in the database"""
     try:
-        return db.get_all_players()
+        return await run_db(db.get_all_players)
     except Exception as e:
         logger.error(f"Get players error: {e}")
         raise HTTPException(status_code=500, detail="Error fetching players")
@@ -179,7 +280,7 @@ async def get_all_players(db: DatabaseManager = Depends(get_db_manager)) -> List
 async def get_all_teams(db: DatabaseManager = Depends(get_db_manager)) -> List[str]:
     """Get all teams in the database"""
     try:
-        return db.get_all_teams()
+        return await run_db(db.get_all_teams)
     except Exception as e:
         logger.error(f"Get teams error: {e}")
         raise HTTPException(status_code=500, detail="Error fetching teams")
@@ -188,7 +289,7 @@ async def get_all_teams(db: DatabaseManager = Depends(get_db_manager)) -> List[s
 async def get_all_venues(db: DatabaseManager = Depends(get_db_manager)) -> List[str]:
     """Get all venues in the database"""
     try:
-        return db.get_all_venues()
+        return await run_db(db.get_all_venues)
     except Exception as e:
         logger.error(f"Get venues error: {e}")
         raise HTTPException(status_code=500, detail="Error fetching venues")
@@ -197,35 +298,51 @@ async def get_all_venues(db: DatabaseManager = Depends(get_db_manager)) -> List[
 async def get_summary_stats(db: DatabaseManager = Depends(get_db_manager)) -> Dict[str, Any]:
     """Get summary statistics of the database"""
     try:
-        summary_query = """
-        SELECT 
-            COUNT(DISTINCT match_id) as total_matches,
-            COUNT(DISTINCT batter_full_name) as total_batters,
-            COUNT(DISTINCT bowler_full_name) as total_bowlers,
-            COUNT(DISTINCT venue) as total_venues,
-            COUNT(DISTINCT season) as total_seasons,
-            MIN(date) as earliest_date,
-            MAX(date) as latest_date,
-            COUNT(*) as total_balls
-        FROM ipl_data
-        """
-        
-        result = db.execute_query(summary_query)
-        return result[0] if result else {}
+        return await run_db(db.get_stats_summary)
         
     except Exception as e:
         logger.error(f"Summary stats error: {e}")
         raise HTTPException(status_code=500, detail="Error fetching summary statistics")
 
+@app.get("/bootstrap")
+async def bootstrap(db: DatabaseManager = Depends(get_db_manager)) -> Dict[str, Any]:
+    """Get players, teams, venues and summary statistics in one response"""
+    try:
+        payload = bootstrap_cache.get("bootstrap")
+        if payload is None:
+            # The four lookups are independent; run them side by side on
+            # separate pooled connections instead of one after another
+            players, teams, venues, summary = await asyncio.gather(
+                run_db(db.get_all_players),
+                run_db(db.get_all_teams),
+                run_db(db.get_all_venues),
+                run_db(db.get_stats_summary)
+            )
+            payload = {
+                "players": players,
+                "teams": teams,
+                "venues": venues,
+                "summary": summary
+            }
+            bootstrap_cache["bootstrap"] = payload
+        return payload
+        
+    except Exception as e:
+        logger.error(f"Bootstrap error: {e}")
+        raise HTTPException(status_code=500, detail="Error fetching bootstrap data")
+
 @app.post("/query/validate")
-async def validate_query(query: ChatQuery) -> Dict[str, Any]:
+async def validate_query(query: ChatQuery, db: DatabaseManager = Depends(get_db_manager)) -> Dict[str, Any]:
     """Validate and preview a query without execution"""
     try:
         qg = get_query_generator()
-        query_result = qg.generate_sql_query(query.query)
+        async with llm_semaphore:
+            query_result = await run_in_threadpool(qg.generate_sql_query, query.query)
         
+        error = await check_sql(db, query_result)
         return {
-            "valid": bool(query_result.get("sql_query")),
+            "valid": error is None,
+            "error": error,
             "sql_query": query_result.get("sql_query"),
             "matched_players": query_result.get("matched_players", []),
             "query_type": classify_query_type(query.query)
@@ -235,20 +352,106 @@ async def validate_query(query: ChatQuery) -> Dict[str, Any]:
         logger.error(f"Query validation error: {e}")
         raise HTTPException(status_code=500, detail="Error validating query")
 
+@app.post("/query/validate/batch")
+async def validate_queries_batch(batch: BatchQuery, db: DatabaseManager = Depends(get_db_manager)) -> List[Dict[str, Any]]:
+    """Validate and preview several queries, generating all the SQL in one Groq call"""
+    import time
+    try:
+        qg = get_query_generator()
+        async with llm_semaphore:
+            # Past the deadline, misses use the rule-based fallback instead of
+            # one Groq call each while holding the semaphore
+            query_results = await run_in_threadpool(
+                qg.generate_sql_queries_batch, batch.queries, time.monotonic() + CHAT_BATCH_BUDGET
+            )
+        
+        errors = await asyncio.gather(*(check_sql(db, query_result) for query_result in query_results))
+        return [
+            {
+                "query": query,
+                "valid": error is None,
+                "error": error,
+                "sql_query": query_result.get("sql_query"),
+                "matched_players": query_result.get("matched_players", []),
+                "query_type": classify_query_type(query)
+            }
+            for query, query_result, error in zip(batch.queries, query_results, errors)
+        ]
+        
+    except Exception as e:
+        logger.error(f"Batch query validation error: {e}")
+        raise HTTPException(status_code=500, detail="Error validating queries")
+
 # Helper functions
-def round_decimal_values(data: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-    """Round decimal values to 2 decimal places"""
-    if not data:
-        return data
+async def run_db(func, *args, **kwargs):
+    """Run a blocking DatabaseManager call on the threadpool, holding one of
+    the pool's connection slots while it runs"""
+    async with db_semaphore:
+        return await run_in_threadpool(func, *args, **kwargs)
+
+async def answer_query(db: DatabaseManager, query: str, query_result: Dict[str, Any], deadline: float) -> ChatResponse:
+    """Execute one generated query for a batch, reporting errors in the response text"""
+    if not query_result.get("sql_query"):
+        return ChatResponse(response="Could not generate valid SQL query")
+    
+    loop = asyncio.get_running_loop()
+    try:
+        sql_query = prepare_sql(query_result["sql_query"], MAX_CHAT_ROWS)
+        # Waiting for a pool slot and the statement itself both stop at the
+        # deadline; statement_timeout makes Postgres cancel the query, so it
+        # doesn't keep running on the connection after we give up
+        await asyncio.wait_for(db_semaphore.acquire(), max(0.0, deadline - loop.time()))
+        try:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                raise TimeoutError
+            data = await run_in_threadpool(
+                db.execute_query, sql_query, query_result.get("params"), remaining, round_floats=True
+            )
+        finally:
+            db_semaphore.release()
+    except asyncio.TimeoutError:
+        logger.warning(f"Batch query timed out for '{query}'")
+        return ChatResponse(
+            response="This query took too long to run. Please try asking it on its own.",
+            sql_query=query_result["sql_query"],
+            matched_players=query_result.get("matched_players", [])
+        )
+    except Exception as e:
+        logger.error(f"Batch query error for '{query}': {e}")
+        return ChatResponse(
+            response=f"Error processing query: {str(e)}",
+            sql_query=query_result["sql_query"],
+            matched_players=query_result.get("matched_players", [])
+        )
     
-    for row in data:
-        for key, value in row.items():
-            if isinstance(value, Decimal):
-                row[key] = round(float(value), 2)
-            elif isinstance(value, float):
-                row[key] = round(value, 2)
+    return ChatResponse(
+        response=generate_response_text(query, data, query_result.get("matched_players", [])),
+        data=data,
+        sql_query=query_result["sql_query"],
+        matched_players=query_result.get("matched_players", [])
+    )
+
+async def check_sql(db: DatabaseManager, query_result: Dict[str, Any]) -> Optional[str]:
+    """Parse the generated SQL locally, then ask Postgres to plan it (EXPLAIN,
+    no execution); returns the error message, or None if the query is valid"""
+    sql_query = query_result.get("sql_query")
+    if not sql_query:
+        return "Could not generate valid SQL query"
     
-    return data
+    # Reject syntax errors and anything but one read-only query in-process
+    # before touching Postgres
+    try:
+        sql_query = prepare_sql(sql_query)
+    except ValueError as e:
+        return str(e)
+    
+    try:
+        # Plan the parsed statement, never the raw text the model returned
+        await run_db(db.explain_query, sql_query, query_result.get("params"))
+        return None
+    except Exception as e:
+        return str(e)
 
 def generate_response_text(original_query: str, data: List[Dict[str, Any]], matched_players: List[str]) -> str:
     """Generate natural language response based on query results"""
@@ -272,20 +475,27 @@ def generate_response_text(original_query: str, data: List[Dict[str, Any]], matc
     
     return f"I found {len(data)} records matching your query:"
 
+# Query-type keywords in priority order, compiled into one alternation so
+# classification is a single scan over the query
+QUERY_TYPE_KEYWORDS = {
+    'batting': ['batting', 'runs', 'average', 'strike rate'],
+    'bowling': ['bowling', 'wickets', 'economy'],
+    'match': ['match', 'team', 'vs'],
+    'ranking': ['best', 'worst', 'top', 'highest'],
+}
+QUERY_TYPE_RE = re.compile('|'.join(
+    f"(?P<{query_type}>{'|'.join(map(re.escape, words))})"
+    for query_type, words in QUERY_TYPE_KEYWORDS.items()
+))
+
 def classify_query_type(query: str) -> str:
     """Classify the type of cricket query"""
-    query_lower = query.lower()
+    found = {match.lastgroup for match in QUERY_TYPE_RE.finditer(query.lower())}
     
-    if any(word in query_lower for word in ['batting', 'runs', 'average', 'strike rate']):
-        return 'batting'
-    elif any(word in query_lower for word in ['bowling', 'wickets', 'economy']):
-        return 'bowling'
-    elif any(word in query_lower for word in ['match', 'team', 'vs']):
-        return 'match'
-    elif any(word in query_lower for word in ['best', 'worst', 'top', 'highest']):
-        return 'ranking'
-    else:
-        return 'general'
+    for query_type in QUERY_TYPE_KEYWORDS:
+        if query_type in found:
+            return query_type
+    return 'general'
 
 if __name__ == "__main__":
     import uvicorn
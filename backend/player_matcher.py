@@ -1,127 +1,335 @@
-from fuzzywuzzy import fuzz, process
+import ahocorasick
+import numpy as np
+from rapidfuzz import fuzz, process
+from rapidfuzz.utils import default_process
 from typing import List, Dict, Optional, Tuple
 import re
+import sys
+import bisect
 import logging
+import threading
+import hashlib
+import pickle
+import os
+from cachetools import LRUCache
 
 logger = logging.getLogger(__name__)
 
+# Bump whenever the matcher's attributes change, so pickles saved by
+# load_or_build under older code are rebuilt instead of reused
+MATCHER_FORMAT_VERSION = 2
+
+# Shorter prefixes are too ambiguous to resolve without fuzzy scoring
+MIN_PREFIX_LENGTH = 3
+
+TITLE_PREFIX_RE = re.compile(r'^(Mr|Ms|Dr)\.?\s*', re.IGNORECASE)
+
+# Common cricket query patterns fused into one alternation, so the query is
+# scanned once: "<stat> [of|for|by] Name", "Name vs|against|...|in|at",
+# "best|top|... [batting|bowling] [by|from] Name"
+_NAME = r'[A-Z][a-z]+(?:\s+[A-Z][a-z]*)*'
+PLAYER_NAME_RE = re.compile(
+    rf'(?:stats|performance|record|average|runs|wickets)(?:\s+(?:of|for|by))?\s+(?P<after_stat>{_NAME})'
+    rf'|(?P<before_keyword>{_NAME})\s+(?:vs|against|batting|bowling|in|during|at)'
+    rf'|(?:best|worst|top|highest|lowest)\s+(?:batting|bowling)?\s*(?:by|from)?\s+(?P<after_rank>{_NAME})'
+)
+
 class PlayerNameMatcher:
-    def __init__(self, all_players: List[str]):
+    def __init__(self, all_players: List[str], match_cache_size: int = 4096):
         self.all_players = all_players
         self.player_variations = self._create_player_variations()
+        
+        # Pre-normalized search index (lowercased, punctuation stripped) so
+        # searches don't re-process every name on each call
+        self._choices = [player for player in all_players if player]
+        self._processed_choices = [default_process(player) for player in self._choices]
+        self._variation_keys = list(self.player_variations.keys())
+        self._processed_variation_keys = [default_process(key) for key in self._variation_keys]
+        self._sorted_variation_keys = sorted(self._variation_keys)
+        
+        # Variation key indexes bucketed by processed length, for the
+        # fuzz.ratio length-bound prefilter in _fuzzy_matches
+        self._variation_indexes_by_length = {}
+        for index, key in enumerate(self._processed_variation_keys):
+            self._variation_indexes_by_length.setdefault(len(key), []).append(index)
+        self._mention_automaton = self._build_mention_automaton()
+        
+        # Chat queries keep asking about the same few players; remember the
+        # fuzzy verdicts (a new matcher starts with an empty cache)
+        self._match_cache_size = match_cache_size
+        self._match_cache = LRUCache(maxsize=match_cache_size)
+        self._match_cache_lock = threading.Lock()
+    
+    @classmethod
+    def load_or_build(cls, path: str, all_players: List[str]) -> "PlayerNameMatcher":
+        """Reuse a pickled matcher from an earlier run if the roster hasn't
+        changed, otherwise build one and save it for next time"""
+        checksum = cls._roster_checksum(all_players)
+        if os.path.exists(path):
+            try:
+                with open(path, "rb") as f:
+                    saved_checksum, matcher = pickle.load(f)
+                if saved_checksum == checksum:
+                    return matcher
+            except Exception as e:
+                logger.warning(f"Could not load player matcher from {path}: {e}")
+        
+        matcher = cls(all_players)
+        matcher.save(path)
+        return matcher
+    
+    def save(self, path: str):
+        """Pickle the built indexes so the next start can skip rebuilding them"""
+        try:
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, "wb") as f:
+                pickle.dump((self._roster_checksum(self.all_players), self), f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            logger.warning(f"Could not save player matcher to {path}: {e}")
+    
+    @staticmethod
+    def _roster_checksum(all_players: List[str]) -> str:
+        roster = "\n".join(player or "" for player in all_players)
+        return hashlib.sha256(f"{MATCHER_FORMAT_VERSION}\n{roster}".encode()).hexdigest()
+    
+    def __getstate__(self):
+        # The match cache and its lock are per-process
+        state = self.__dict__.copy()
+        del state["_match_cache"], state["_match_cache_lock"]
+        return state
+    
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._match_cache = LRUCache(maxsize=self._match_cache_size)
+        self._match_cache_lock = threading.Lock()
     
     def _create_player_variations(self) -> Dict[str, str]:
         """Create variations of player names for better matching"""
         variations = {}
+        # Only pay for the prefix regex if some name actually has one
+        has_prefixes = any(player and TITLE_PREFIX_RE.match(player) for player in self.all_players)
         
         for player in self.all_players:
             if not player:
                 continue
-                
+            
+            # Every variation points at the same interned full name
+            canonical = sys.intern(player)
+            lower = sys.intern(player.lower())
+            
             # Store full name
-            variations[player.lower()] = player
+            variations[lower] = canonical
             
-            # Create variations
-            parts = player.split()
+            # Create variations from the lowercased parts
+            parts = lower.split()
             
-            # First name + Last name
             if len(parts) >= 2:
-                first_last = f"{parts[0]} {parts[-1]}"
-                variations[first_last.lower()] = player
+                # Keys are interned too, so the sorted/processed key lists and
+                # the dict share one string object per key
+                first, last = sys.intern(parts[0]), sys.intern(parts[-1])
+                
+                # First name + Last name
+                variations[sys.intern(first + ' ' + last)] = canonical
                 
                 # Just first name
-                variations[parts[0].lower()] = player
+                variations[first] = canonical
                 
-                # Just last name  
-                variations[parts[-1].lower()] = player
+                # Just last name
+                variations[last] = canonical
                 
                 # Initials + Last name (like V Kohli for Virat Kohli)
-                if len(parts[0]) > 1:
-                    initial_last = f"{parts[0][0]} {parts[-1]}"
-                    variations[initial_last.lower()] = player
+                if len(first) > 1:
+                    variations[sys.intern(first[0] + ' ' + last)] = canonical
             
             # Remove common prefixes/suffixes
-            clean_name = re.sub(r'^(Mr|Ms|Dr)\.?\s*', '', player, flags=re.IGNORECASE)
-            if clean_name != player:
-                variations[clean_name.lower()] = player
+            if has_prefixes:
+                clean_name = TITLE_PREFIX_RE.sub('', lower)
+                if clean_name != lower:
+                    variations[sys.intern(clean_name)] = canonical
         
         return variations
     
+    def _build_mention_automaton(self):
+        """Aho-Corasick automaton over the multi-word name variations, for
+        spotting literal player mentions in a single pass over the query"""
+        automaton = ahocorasick.Automaton()
+        for key, player in self.player_variations.items():
+            # Single tokens ("best", "ms", first names) collide with ordinary
+            # words, so leave those to the regex + fuzzy path
+            if ' ' in key:
+                automaton.add_word(key, (len(key), player))
+        
+        if len(automaton):
+            automaton.make_automaton()
+        return automaton
+    
+    def _scan_mentions(self, query: str) -> Dict[str, str]:
+        """Matched variation key -> player for every verbatim mention, in query order"""
+        if self._mention_automaton.kind != ahocorasick.AHOCORASICK:
+            return {}
+        
+        query_lower = query.lower()
+        found = {}
+        for end, (length, player) in self._mention_automaton.iter(query_lower):
+            start = end - length + 1
+            if start > 0 and query_lower[start - 1].isalnum():
+                continue
+            if end + 1 < len(query_lower) and query_lower[end + 1].isalnum():
+                continue
+            found.setdefault(query_lower[start:end + 1], player)
+        
+        return found
+    
     def find_best_match(self, query_name: str, threshold: int = 70) -> Optional[str]:
         """Find the best matching player name"""
-        if not query_name:
-            return None
-            
-        query_name = query_name.strip()
-        query_lower = query_name.lower()
-        
-        # Direct match in variations
-        if query_lower in self.player_variations:
-            return self.player_variations[query_lower]
-        
-        # Fuzzy match on full names
-        best_match = process.extractOne(
-            query_name, 
-            self.all_players, 
-            scorer=fuzz.partial_ratio
-        )
+        return self.find_best_matches([query_name], threshold)[0]
+    
+    def _resolve_exact(self, query_lower: str) -> Optional[str]:
+        """Direct variation lookup, then prefix match ("kohl" -> "kohli") via
+        binary search; None if fuzzy scoring is needed"""
+        match = self.player_variations.get(query_lower)
+        if match:
+            return match
         
-        if best_match and best_match[1] >= threshold:
-            return best_match[0]
+        if len(query_lower) >= MIN_PREFIX_LENGTH:
+            # Every key starting with the prefix sorts into [prefix, prefix + "\uffff");
+            # the prefix only counts if all of them name the same player
+            keys = self._sorted_variation_keys
+            start = bisect.bisect_left(keys, query_lower)
+            end = bisect.bisect_left(keys, query_lower + "\uffff", start)
+            players = set()
+            for key in keys[start:end]:
+                players.add(self.player_variations[key])
+                if len(players) > 1:
+                    return None
+            if players:
+                return players.pop()
+        return None
+    
+    def _variation_candidates(self, query_length: int, threshold: int) -> List[int]:
+        """Indexes of variation keys whose length can still reach the threshold:
+        a fuzz.ratio of t needs |len(a) - len(b)| <= (len(a) + len(b)) * (1 - t)"""
+        slack = 1 - threshold / 100
+        candidates = []
+        for length, indexes in self._variation_indexes_by_length.items():
+            if abs(length - query_length) <= (length + query_length) * slack:
+                candidates.extend(indexes)
+        # Keep roster order so ties resolve the same way as a full scan
+        candidates.sort()
+        return candidates
+    
+    def find_best_matches(self, query_names: List[str], threshold: int = 70) -> List[Optional[str]]:
+        """Resolve several names at once: exact/prefix lookups and remembered
+        verdicts first, then one cdist call for the real misses"""
+        results = [self._resolve_exact(name.strip().lower()) if name else None for name in query_names]
+        pending = []
+        with self._match_cache_lock:
+            for i, match in enumerate(results):
+                if match is not None or not query_names[i]:
+                    continue
+                key = (query_names[i].strip().lower(), threshold)
+                if key in self._match_cache:
+                    results[i] = self._match_cache[key]
+                else:
+                    pending.append(i)
+        if not pending:
+            return results
         
-        # Fuzzy match on variations
-        variation_keys = list(self.player_variations.keys())
-        best_variation = process.extractOne(
-            query_lower,
-            variation_keys,
-            scorer=fuzz.ratio
+        self._fuzzy_matches(query_names, pending, results, threshold)
+        
+        # Remember the verdicts, misses included, for the next question
+        with self._match_cache_lock:
+            for i in pending:
+                self._match_cache[(query_names[i].strip().lower(), threshold)] = results[i]
+        return results
+    
+    def _fuzzy_matches(self, query_names: List[str], pending: List[int], results: List[Optional[str]], threshold: int):
+        """Fill results[i] for each pending index by fuzzy scoring"""
+        processed_queries = [default_process(query_names[i]) for i in pending]
+        
+        # Score matrix (queries x players) computed in C++ across all cores
+        scores = process.cdist(
+            processed_queries,
+            self._processed_choices,
+            scorer=fuzz.partial_ratio,
+            score_cutoff=threshold,
+            dtype=np.uint8,
+            workers=-1
         )
+        unmatched = []
+        for row, i in enumerate(pending):
+            if scores.shape[1] and scores[row].max() >= threshold:
+                results[i] = self._choices[int(scores[row].argmax())]
+            else:
+                unmatched.append(row)
         
-        if best_variation and best_variation[1] >= threshold:
-            return self.player_variations[best_variation[0]]
+        if not unmatched:
+            return
         
-        return None
+        # Fall back to the variation keys for the rest, scored with fuzz.ratio
+        # (bit-parallel Indel, so a short key fits in one machine word);
+        # queries are grouped by length so keys whose length alone rules out
+        # the cutoff are never scored
+        rows_by_length = {}
+        for row in unmatched:
+            rows_by_length.setdefault(len(processed_queries[row]), []).append(row)
+        
+        for query_length, rows in rows_by_length.items():
+            candidates = self._variation_candidates(query_length, threshold)
+            if not candidates:
+                continue
+            scores = process.cdist(
+                [processed_queries[row] for row in rows],
+                [self._processed_variation_keys[index] for index in candidates],
+                scorer=fuzz.ratio,
+                score_cutoff=threshold,
+                dtype=np.float32,
+                workers=-1
+            )
+            for score_row, row in enumerate(rows):
+                # Scores under score_cutoff come back as 0
+                if scores[score_row].max() > 0:
+                    key = self._variation_keys[candidates[int(scores[score_row].argmax())]]
+                    results[pending[row]] = self.player_variations[key]
     
     def find_multiple_matches(self, query_name: str, limit: int = 5, threshold: int = 60) -> List[Tuple[str, int]]:
         """Find multiple possible matches for a query"""
         if not query_name:
             return []
             
-        # Get fuzzy matches
+        # Candidates under the threshold are pruned inside rapidfuzz
         matches = process.extract(
-            query_name,
-            self.all_players,
+            default_process(query_name),
+            self._processed_choices,
             scorer=fuzz.partial_ratio,
-            limit=limit
+            limit=limit,
+            score_cutoff=threshold
         )
         
-        # Filter by threshold
-        return [(match[0], match[1]) for match in matches if match[1] >= threshold]
+        # Map back to the original names by index
+        return [(self._choices[index], int(round(score))) for _, score, index in matches]
     
     def extract_player_names_from_query(self, query: str) -> List[str]:
         """Extract potential player names from a natural language query"""
-        # Common cricket query patterns
-        patterns = [
-            r'(?:stats|performance|record|average|runs|wickets)(?:\s+(?:of|for|by))?\s+([A-Z][a-z]+(?:\s+[A-Z][a-z]*)*)',
-            r'([A-Z][a-z]+(?:\s+[A-Z][a-z]*)*)\s+(?:vs|against|batting|bowling)',
-            r'(?:best|worst|top|highest|lowest)\s+(?:batting|bowling)?\s*(?:by|from)?\s+([A-Z][a-z]+(?:\s+[A-Z][a-z]*)*)',
-            r'([A-Z][a-z]+(?:\s+[A-Z][a-z]*)*)\s+(?:in|during|at)'
-        ]
-        
-        potential_names = []
-        
-        for pattern in patterns:
-            matches = re.findall(pattern, query)
-            potential_names.extend(matches)
+        # Exact mentions are found in one automaton pass and need no fuzzy scoring
+        mentions = self._scan_mentions(query)
         
-        # Remove duplicates and clean
-        unique_names = list(set(potential_names))
+        potential_names = [
+            match.group('after_stat') or match.group('before_keyword') or match.group('after_rank')
+            for match in PLAYER_NAME_RE.finditer(query)
+        ]
         
-        # Match against our player database
-        matched_names = []
-        for name in unique_names:
-            best_match = self.find_best_match(name)
-            if best_match and best_match not in matched_names:
-                matched_names.append(best_match)
+        # Remove duplicates (keeping the order they appear in), names the
+        # automaton already resolved, and fragments too short to fuzzy-match
+        # meaningfully ("In", "At" at the start of a sentence)
+        missing = [
+            name for name in dict.fromkeys(name.strip() for name in potential_names)
+            if len(name) >= MIN_PREFIX_LENGTH and name.lower() not in mentions
+        ]
         
-        return matched_names
\ No newline at end of file
+        # Match the rest against our player database in one batch
+        matched_names = list(mentions.values())
+        if missing:
+            matched_names.extend(self.find_best_matches(missing))
+        return list(dict.fromkeys(match for match in matched_names if match))
\ No newline at end of file
@@ -1,17 +1,197 @@
 from groq import Groq
+import sqlglot
+from sqlglot import exp
 import re
 import json
+import textwrap
 import logging
+import threading
+import hashlib
+import shelve
+import time
+from cachetools import LRUCache
 from typing import Dict, List, Optional, Any
 from player_matcher import PlayerNameMatcher
 
 logger = logging.getLogger(__name__)
 
+# All minimum-threshold phrasings in one pattern so the query is scanned once:
+# "min/minimum [of] N", "at least N", "more than N", optionally followed by "runs"
+MIN_THRESHOLD_RE = re.compile(r'(?P<keyword>min(?:imum)?(?:\s+of)?|at least|more than)\s+(?P<value>\d+)(?P<runs>\s+runs?)?')
+
+SQL_MODEL = "llama-3.1-8b-instant"
+
+# Quotes and trailing ?!. don't change the SQL, so they are dropped from the
+# cache key; operators (<, >, =, %) and number separators are kept
+QUOTE_RE = re.compile(r'[\'"`\u2018\u2019\u201c\u201d]')
+
+SELECT_RE = re.compile(r'SELECT\s', re.IGNORECASE)
+
+# A SELECT can still write: data-modifying CTEs and SELECT ... INTO
+WRITE_NODES = (exp.Insert, exp.Update, exp.Delete, exp.Merge, exp.Into)
+
+def prepare_sql(sql_query: str, row_limit: Optional[int] = None) -> str:
+    """Parse generated SQL and return its canonical text; raises ValueError
+    unless it is exactly one read-only query. With row_limit, a query that
+    sets no LIMIT of its own gets one"""
+    # parse_one keeps only the first of several statements, so parse them all
+    try:
+        trees = [tree for tree in sqlglot.parse(sql_query, read="postgres") if tree is not None]
+    except sqlglot.errors.ParseError as e:
+        raise ValueError(f"Syntax: {e}") from e
+    if len(trees) != 1:
+        raise ValueError("Exactly one SQL statement is allowed")
+    tree = trees[0]
+    if not isinstance(tree, exp.Query):
+        raise ValueError("Only SELECT queries are allowed")
+    if tree.find(*WRITE_NODES):
+        raise ValueError("Only read-only queries are allowed")
+    if row_limit is not None and not tree.args.get("limit"):
+        # Added to the tree, so ORDER BY still applies and trailing comments
+        # can't swallow anything
+        tree = tree.limit(row_limit)
+    return tree.sql(dialect="postgres")
+
+SQL_INSTRUCTIONS = """
+Instructions:
+1. Generate ONLY a valid PostgreSQL SELECT query
+2. Use exact player names from the detected players list when available
+3. Handle partial names by using ILIKE with wildcards
+4. For batting stats, focus on batter_full_name and batting-related columns
+5. For bowling stats, focus on bowler_full_name and bowling-related columns
+6. For advanced queries like "best batters vs pace in death overs":
+   - Filter by over_col BETWEEN 16 AND 20 for death overs
+   - Filter by bowling_style containing 'pace' for pace bowlers
+   - Group by batter_full_name and calculate aggregations
+7. For "best bowlers vs LHB in middle overs":
+   - Filter by over_col BETWEEN 7 AND 15 for middle overs
+   - Filter by bat_hand = 'LHB' for left-hand batsmen
+   - Group by bowler_full_name and calculate bowling stats
+8. Use appropriate aggregations (SUM, AVG, COUNT, MAX, MIN)
+9. Order results meaningfully (best performance first)
+10. Limit results to reasonable numbers (typically TOP 10-20)
+11. Handle NULL values appropriately
+12. For strike rates, use: (SUM(runs_batter) * 100.0 / COUNT(CASE WHEN valid_ball = 1 THEN 1 END))
+13. For bowling average, use: (SUM(runs_total) * 1.0 / COUNT(CASE WHEN is_wicket = true THEN 1 END))
+14. For economy rate, use: (SUM(runs_total) * 6.0 / COUNT(CASE WHEN valid_ball = 1 THEN 1 END))
+15. ALWAYS apply minimum thresholds to filter meaningful results:
+    - For batting queries: HAVING SUM(runs_batter) >= 500 (or user-specified minimum)
+    - For bowling queries: HAVING COUNT(CASE WHEN valid_ball = 1 THEN 1 END) >= 300 (minimum balls bowled)
+    - For death overs specifically: HAVING SUM(runs_batter) >= 200 (death over runs)
+    - For powerplay: HAVING SUM(runs_batter) >= 300 (powerplay runs)
+    - If user specifies "minimum X runs" or "min X runs", use that exact value
+16. Extract minimum values from user query if specified (e.g., "min 1000 runs", "minimum 500 runs")
+17. IMPORTANT: For boolean columns (is_four, is_six, is_wicket), use COUNT() not SUM():
+    - For fours: COUNT(CASE WHEN is_four = true THEN 1 END) AS fours
+    - For sixes: COUNT(CASE WHEN is_six = true THEN 1 END) AS sixes
+    - For wickets: COUNT(CASE WHEN is_wicket = true THEN 1 END) AS wickets
+18. Available seasons in database: 2008-2024 (no 2025 data available yet)
+"""
+
+# Response shapes; exactly one is appended to the instructions
+SINGLE_RESPONSE_FORMAT = """
+Return a JSON object with the query and nothing else: {"sql": "<SELECT ...>"}
+"""
+
+BATCH_INSTRUCTIONS = """
+You will receive several numbered questions. Answer each one independently
+following the instructions above, and return a single JSON object:
+{"queries": [{"id": <question number>, "sql": "<SELECT ...>"}, ...]}
+"""
+
+# Questions per batched Groq call; each answer gets up to 400 completion
+# tokens, so larger batches would be cut off mid-JSON
+BATCH_CHUNK_SIZE = 20
+
+# Keywords that pick the fallback query, one scan each. Only the leading
+# boundary is anchored so plurals ("averages", "strike rates") still match
+FALLBACK_BATTING_RE = re.compile(r'\b(?:runs|batting|average|strike rate)')
+FALLBACK_BOWLING_RE = re.compile(r'\b(?:bowling|wickets|economy)')
+
+# Rule-based fallback queries, built once. The batting/bowling ones come as
+# (unfiltered, filtered) pairs; the filtered form takes the player list as a
+# single array parameter
+_FALLBACK_BATTING_TEMPLATE = """
+            SELECT 
+                batter_full_name,
+                COUNT(*) as balls_faced,
+                SUM(runs_batter) as total_runs,
+                ROUND(AVG(runs_batter::numeric), 2) as avg_runs_per_ball,
+                ROUND((SUM(runs_batter) * 100.0 / COUNT(CASE WHEN valid_ball = 1 THEN 1 END)), 2) as strike_rate,
+                SUM(CASE WHEN is_four = true THEN 1 ELSE 0 END) as fours,
+                SUM(CASE WHEN is_six = true THEN 1 ELSE 0 END) as sixes
+            FROM ipl_data 
+            {player_filter}
+            GROUP BY batter_full_name 
+            HAVING COUNT(*) > 50
+            ORDER BY total_runs DESC 
+            LIMIT 20
+            """
+
+_FALLBACK_BOWLING_TEMPLATE = """
+            SELECT 
+                bowler_full_name,
+                COUNT(CASE WHEN valid_ball = 1 THEN 1 END) as balls_bowled,
+                SUM(runs_total) as runs_conceded,
+                COUNT(CASE WHEN is_wicket = true THEN 1 END) as wickets,
+                ROUND((SUM(runs_total) * 6.0 / COUNT(CASE WHEN valid_ball = 1 THEN 1 END)), 2) as economy_rate,
+                ROUND((SUM(runs_total) * 1.0 / NULLIF(COUNT(CASE WHEN is_wicket = true THEN 1 END), 0)), 2) as bowling_average
+            FROM ipl_data 
+            {player_filter}
+            GROUP BY bowler_full_name 
+            HAVING COUNT(CASE WHEN valid_ball = 1 THEN 1 END) > 100
+            ORDER BY wickets DESC 
+            LIMIT 20
+            """
+
+FALLBACK_BATTING_SQL = (
+    _FALLBACK_BATTING_TEMPLATE.format(player_filter=""),
+    _FALLBACK_BATTING_TEMPLATE.format(player_filter="WHERE batter_full_name = ANY(%s)"),
+)
+
+FALLBACK_BOWLING_SQL = (
+    _FALLBACK_BOWLING_TEMPLATE.format(player_filter=""),
+    _FALLBACK_BOWLING_TEMPLATE.format(player_filter="WHERE bowler_full_name = ANY(%s)"),
+)
+
+FALLBACK_DEFAULT_SQL = """
+            SELECT 
+                batter_full_name,
+                SUM(runs_batter) as total_runs,
+                COUNT(*) as balls_faced,
+                ROUND((SUM(runs_batter) * 100.0 / COUNT(CASE WHEN valid_ball = 1 THEN 1 END)), 2) as strike_rate
+            FROM ipl_data 
+            GROUP BY batter_full_name 
+            HAVING COUNT(*) > 100
+            ORDER BY total_runs DESC 
+            LIMIT 15
+            """
+
 class CricketQueryGenerator:
-    def __init__(self, groq_api_key: str, player_matcher: PlayerNameMatcher):
-        self.client = Groq(api_key=groq_api_key)
+    def __init__(
+        self,
+        groq_api_key: str,
+        player_matcher: PlayerNameMatcher,
+        sql_cache_size: int = 1024,
+        sql_cache_path: Optional[str] = None,
+        sql_cache_ttl: int = 7 * 24 * 3600
+    ):
+        # The Groq client is created on first use; questions answered from
+        # the SQL cache never need it
+        self._groq_api_key = groq_api_key
+        self._client = None
+        self._client_lock = threading.Lock()
         self.player_matcher = player_matcher
         
+        # Generated SQL keyed on the normalized question and its extracted
+        # context, so repeat questions skip the Groq round-trip
+        self._sql_cache = LRUCache(maxsize=sql_cache_size)
+        self._sql_cache_lock = threading.Lock()
+        
+        # Optional on-disk copy so generated SQL survives restarts
+        self._sql_shelf = shelve.open(sql_cache_path) if sql_cache_path else None
+        self._sql_shelf_ttl = sql_cache_ttl
+        
         # Cricket-specific context and schema
         self.cricket_schema = """
         Table: ipl_data
@@ -94,7 +274,6 @@ class CricketQueryGenerator:
         - curr_batter_balls (INTEGER): Current batter balls
         - curr_batter_fours (INTEGER): Current batter fours
         - curr_batter_sixes (INTEGER): Current batter sixes
-        - bowling_type (TEXT): Bowling type
         - required_rr (TEXT): Required run rate
         - current_rr (TEXT): Current run rate
         - batting_partners (TEXT): Batting partnership
@@ -113,28 +292,85 @@ class CricketQueryGenerator:
         - Strike Rate: (SUM(runs_batter) * 100.0 / COUNT(CASE WHEN valid_ball = 1 THEN 1 END))
         - Economy Rate: (SUM(runs_total) * 6.0 / COUNT(CASE WHEN valid_ball = 1 THEN 1 END))
         """
+        
+        # Stable prompt prefixes, built once
+        base_prompt = (
+            "You are an expert cricket analyst and SQL query generator. "
+            "Generate a PostgreSQL query to answer the user's cricket question.\n"
+            + textwrap.dedent(self.cricket_schema)
+            + "\n"
+            + SQL_INSTRUCTIONS
+        )
+        self._system_prompt = base_prompt + SINGLE_RESPONSE_FORMAT
+        self._batch_system_prompt = base_prompt + BATCH_INSTRUCTIONS
+        # Part of every on-disk cache key, so a model or prompt change
+        # never serves SQL written for the old one
+        self._prompt_version = hashlib.sha256((SQL_MODEL + self._system_prompt).encode()).hexdigest()[:16]
     
     def extract_minimum_threshold(self, user_query: str) -> Optional[int]:
         """Extract minimum threshold from user query"""
-        patterns = [
-            r'min(?:imum)?\s+(\d+)\s+runs?',
-            r'at least\s+(\d+)\s+runs?',
-            r'more than\s+(\d+)\s+runs?',
-            r'minimum\s+of\s+(\d+)\s+runs?',
-            r'min\s+(\d+)',
-            r'minimum\s+(\d+)'
-        ]
-        
-        for pattern in patterns:
-            match = re.search(pattern, user_query.lower())
-            if match:
-                return int(match.group(1))
-        
-        return None
-
-    def generate_sql_query(self, user_query: str, matched_players: List[str] = None) -> Dict[str, Any]:
-        """Generate SQL query using Groq API"""
+        # A "... N runs" phrasing wins; a bare "min N" / "minimum N" is the fallback
+        fallback = None
+        for match in MIN_THRESHOLD_RE.finditer(user_query.lower()):
+            if match.group('runs'):
+                return int(match.group('value'))
+            if fallback is None and match.group('keyword') in ('min', 'minimum'):
+                fallback = int(match.group('value'))
         
+        return fallback
+
+    @property
+    def client(self) -> Groq:
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    self._client = Groq(api_key=self._groq_api_key)
+        return self._client
+    
+    def close(self):
+        """Flush and close the on-disk SQL cache and the Groq client"""
+        if self._sql_shelf is not None:
+            with self._sql_cache_lock:
+                self._sql_shelf.close()
+                self._sql_shelf = None
+        if self._client is not None:
+            self._client.close()
+            self._client = None
+    
+    def _shelf_key(self, cache_key: tuple) -> str:
+        return hashlib.sha256(f"{self._prompt_version}|{cache_key!r}".encode()).hexdigest()
+    
+    def _get_cached_sql(self, cache_key: tuple) -> Optional[str]:
+        with self._sql_cache_lock:
+            cached_sql = self._sql_cache.get(cache_key)
+            if cached_sql is not None or self._sql_shelf is None:
+                return cached_sql
+            
+            entry = self._sql_shelf.get(self._shelf_key(cache_key))
+            # Empty entries were written before stored SQL had to validate
+            if entry is None or not entry["sql_query"] or time.time() - entry["timestamp"] > self._sql_shelf_ttl:
+                return None
+            # Promote to the in-memory cache for the next hit
+            self._sql_cache[cache_key] = entry["sql_query"]
+            return entry["sql_query"]
+    
+    def _store_sql(self, cache_key: tuple, sql_query: str):
+        with self._sql_cache_lock:
+            self._sql_cache[cache_key] = sql_query
+            if self._sql_shelf is not None:
+                self._sql_shelf[self._shelf_key(cache_key)] = {"sql_query": sql_query, "timestamp": time.time()}
+    
+    def _store_valid_sql(self, cache_key: tuple, sql_query: str):
+        """Cache SQL only if prepare_sql accepts it, so a bad reply is
+        regenerated next time instead of being replayed"""
+        try:
+            self._store_sql(cache_key, prepare_sql(sql_query))
+        except ValueError as e:
+            logger.warning(f"Not caching rejected SQL: {e}")
+    
+    def _question_context(self, user_query: str, matched_players: List[str] = None):
+        """Resolve players and threshold for a question; returns
+        (matched_players, cache_key, question text for the prompt)"""
         # Extract player names from query if not provided
         if not matched_players:
             matched_players = self.player_matcher.extract_player_names_from_query(user_query)
@@ -142,6 +378,9 @@ class CricketQueryGenerator:
         # Extract minimum threshold if specified
         min_threshold = self.extract_minimum_threshold(user_query)
         
+        normalized_query = ' '.join(QUOTE_RE.sub('', user_query.lower()).split()).rstrip('?!. ')
+        cache_key = (normalized_query, tuple(sorted(matched_players or ())), min_threshold)
+        
         # Create enhanced prompt with player and threshold context
         player_context = ""
         if matched_players:
@@ -151,64 +390,50 @@ class CricketQueryGenerator:
         if min_threshold:
             threshold_context = f"\nMinimum Threshold: Use {min_threshold} runs as the HAVING condition instead of default values"
         
-        prompt = f"""
-        You are an expert cricket analyst and SQL query generator. Generate a PostgreSQL query to answer the user's cricket question.
-
-        {self.cricket_schema}
-        {player_context}
-        {threshold_context}
-        
-        User Question: "{user_query}"
-        
-        Instructions:
-        1. Generate ONLY a valid PostgreSQL SELECT query
-        2. Use exact player names from the detected players list when available
-        3. Handle partial names by using ILIKE with wildcards
-        4. For batting stats, focus on batter_full_name and batting-related columns
-        5. For bowling stats, focus on bowler_full_name and bowling-related columns
-        6. For advanced queries like "best batters vs pace in death overs":
-           - Filter by over_col BETWEEN 16 AND 20 for death overs
-           - Filter by bowling_style containing 'pace' for pace bowlers
-           - Group by batter_full_name and calculate aggregations
-        7. For "best bowlers vs LHB in middle overs":
-           - Filter by over_col BETWEEN 7 AND 15 for middle overs
-           - Filter by bat_hand = 'LHB' for left-hand batsmen
-           - Group by bowler_full_name and calculate bowling stats
-        8. Use appropriate aggregations (SUM, AVG, COUNT, MAX, MIN)
-        9. Order results meaningfully (best performance first)
-        10. Limit results to reasonable numbers (typically TOP 10-20)
-        11. Handle NULL values appropriately
-        12. For strike rates, use: (SUM(runs_batter) * 100.0 / COUNT(CASE WHEN valid_ball = 1 THEN 1 END))
-        13. For bowling average, use: (SUM(runs_total) * 1.0 / COUNT(CASE WHEN is_wicket = true THEN 1 END))
-        14. For economy rate, use: (SUM(runs_total) * 6.0 / COUNT(CASE WHEN valid_ball = 1 THEN 1 END))
-        15. ALWAYS apply minimum thresholds to filter meaningful results:
-            - For batting queries: HAVING SUM(runs_batter) >= 500 (or user-specified minimum)
-            - For bowling queries: HAVING COUNT(CASE WHEN valid_ball = 1 THEN 1 END) >= 300 (minimum balls bowled)
-            - For death overs specifically: HAVING SUM(runs_batter) >= 200 (death over runs)
-            - For powerplay: HAVING SUM(runs_batter) >= 300 (powerplay runs)
-            - If user specifies "minimum X runs" or "min X runs", use that exact value
-        16. Extract minimum values from user query if specified (e.g., "min 1000 runs", "minimum 500 runs")
-        17. IMPORTANT: For boolean columns (is_four, is_six, is_wicket), use COUNT() not SUM():
-            - For fours: COUNT(CASE WHEN is_four = true THEN 1 END) AS fours
-            - For sixes: COUNT(CASE WHEN is_six = true THEN 1 END) AS sixes
-            - For wickets: COUNT(CASE WHEN is_wicket = true THEN 1 END) AS wickets
-        18. Available seasons in database: 2008-2024 (no 2025 data available yet)
-        
-        Return ONLY the SQL query, no explanations or formatting.
-        """
+        return matched_players, cache_key, f'"{user_query}"{player_context}{threshold_context}'
+    
+    def generate_sql_query(self, user_query: str, matched_players: List[str] = None) -> Dict[str, Any]:
+        """Generate SQL query using Groq API"""
+        matched_players, cache_key, question = self._question_context(user_query, matched_players)
+        
+        cached_sql = self._get_cached_sql(cache_key)
+        if cached_sql is not None:
+            return {
+                "sql_query": cached_sql,
+                "matched_players": matched_players,
+                "original_query": user_query
+            }
+        
+        # Only the per-question part goes in the user message; the schema and
+        # instructions are the same every call and live in the system message
+        user_message = f'User Question: {question}'
         
         try:
             response = self.client.chat.completions.create(
-                model="llama-3.1-8b-instant",
-                messages=[{"role": "user", "content": prompt}],
+                model=SQL_MODEL,
+                messages=[
+                    {"role": "system", "content": self._system_prompt},
+                    {"role": "user", "content": user_message}
+                ],
                 temperature=0.1,
-                max_tokens=1000
+                # Generated queries stay well under this; a lower cap also
+                # bounds how long a runaway completion can take
+                max_tokens=400,
+                # Structured output removes the fences/preamble cleanup; Groq
+                # doesn't stream in JSON mode, so this is a single response
+                response_format={"type": "json_object"}
             )
             
-            sql_query = response.choices[0].message.content.strip()
-            
-            # Clean the query
-            sql_query = self._clean_sql_query(sql_query)
+            content = response.choices[0].message.content
+            try:
+                sql_query = json.loads(content)["sql"].strip()
+            except (ValueError, KeyError, TypeError, AttributeError):
+                # Defensive: fall back to scraping the SQL out of the raw text.
+                # Scraped SQL is never cached, so one bad reply doesn't stick
+                logger.warning("Groq returned malformed JSON, cleaning raw output")
+                sql_query = self._clean_sql_query(content or "")
+            else:
+                self._store_valid_sql(cache_key, sql_query)
             
             return {
                 "sql_query": sql_query,
@@ -218,22 +443,115 @@ class CricketQueryGenerator:
             
         except Exception as e:
             logger.error(f"Error generating query with Groq: {e}")
-            # Fallback to rule-based query generation
+            # Fallback to rule-based query generation; not cached, so a Groq
+            # outage doesn't stick to the question
             return self._fallback_query_generation(user_query, matched_players)
     
+    def generate_sql_queries_batch(self, user_queries: List[str], deadline: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Generate SQL for several questions with batched Groq calls.
+        
+        Cached questions are answered from the cache; the rest go out as
+        numbered lists of up to BATCH_CHUNK_SIZE and come back as JSON arrays.
+        Anything missing from a batch reply falls back to generate_sql_query
+        individually. Past the deadline (a time.monotonic() value) no further
+        Groq calls are made and the rule-based fallback is used instead.
+        """
+        results: List[Optional[Dict[str, Any]]] = [None] * len(user_queries)
+        # Questions that normalize to the same context (wording case/spacing,
+        # resolved players, threshold) get one entry in the prompt
+        pending: Dict[tuple, tuple] = {}
+        
+        for i, user_query in enumerate(user_queries):
+            matched_players, cache_key, question = self._question_context(user_query)
+            cached_sql = self._get_cached_sql(cache_key)
+            if cached_sql is not None:
+                results[i] = {
+                    "sql_query": cached_sql,
+                    "matched_players": matched_players,
+                    "original_query": user_query
+                }
+            elif cache_key in pending:
+                pending[cache_key][2].append(i)
+            else:
+                pending[cache_key] = (matched_players, question, [i])
+        
+        if pending:
+            skipped = sum(len(indexes) - 1 for _, _, indexes in pending.values())
+            if skipped:
+                logger.info(f"Batch SQL generation skipped {skipped} duplicate questions")
+            
+            batch_sql = {}
+            pending_items = list(pending.values())
+            for offset in range(0, len(pending_items), BATCH_CHUNK_SIZE):
+                if deadline is not None and time.monotonic() >= deadline:
+                    break
+                batch_sql.update(self._generate_sql_chunk(pending_items[offset:offset + BATCH_CHUNK_SIZE], offset))
+            
+            for n, (cache_key, (matched_players, _, indexes)) in enumerate(pending.items(), 1):
+                sql_query = batch_sql.get(n)
+                if sql_query is not None:
+                    self._store_valid_sql(cache_key, sql_query)
+                
+                for i in indexes:
+                    if sql_query is None and deadline is not None and time.monotonic() >= deadline:
+                        results[i] = self._fallback_query_generation(user_queries[i], matched_players)
+                    elif sql_query is None:
+                        # After the first retry succeeds the rest are cache hits
+                        results[i] = self.generate_sql_query(user_queries[i], matched_players)
+                    else:
+                        results[i] = {
+                            "sql_query": sql_query,
+                            "matched_players": matched_players,
+                            "original_query": user_queries[i]
+                        }
+        
+        return results
+    
+    def _generate_sql_chunk(self, items: List[tuple], offset: int) -> Dict[int, str]:
+        """One batched Groq call; returns SQL keyed by overall question number
+        (offset + position in the chunk, counting from 1)"""
+        numbered = "\n\n".join(f"{n}. {question}" for n, (_, question, _) in enumerate(items, 1))
+        try:
+            response = self.client.chat.completions.create(
+                model=SQL_MODEL,
+                messages=[
+                    {"role": "system", "content": self._batch_system_prompt},
+                    {"role": "user", "content": f"User Questions:\n{numbered}"}
+                ],
+                temperature=0.1,
+                max_tokens=400 * len(items),
+                response_format={"type": "json_object"}
+            )
+            entries = json.loads(response.choices[0].message.content)["queries"]
+        except Exception as e:
+            logger.error(f"Error generating batch queries with Groq: {e}")
+            return {}
+        
+        # A malformed entry only costs its own question a retry, not the chunk
+        batch_sql = {}
+        for entry in entries if isinstance(entries, list) else ():
+            try:
+                n, sql_query = int(entry["id"]), entry["sql"].strip()
+            except (KeyError, TypeError, ValueError, AttributeError):
+                logger.warning(f"Skipping malformed batch entry: {entry!r}")
+                continue
+            if sql_query and 1 <= n <= len(items):
+                batch_sql[offset + n] = sql_query
+        return batch_sql
+    
     def _clean_sql_query(self, query: str) -> str:
         """Clean and validate the SQL query"""
-        # Remove code block formatting
-        query = re.sub(r'```sql\n?', '', query)
-        query = re.sub(r'```\n?', '', query)
+        # Remove code block formatting (the newline after a fence is dropped
+        # by the whitespace collapse below)
+        query = query.replace('```sql', '').replace('```', '')
         
         # Remove extra whitespace
         query = ' '.join(query.split())
         
         # Ensure it starts with SELECT
-        if not query.upper().startswith('SELECT'):
+        if query[:6].upper() != 'SELECT':
             # Try to find SELECT in the query
-            select_match = re.search(r'SELECT\s', query, re.IGNORECASE)
+            select_match = SELECT_RE.search(query)
             if select_match:
                 query = query[select_match.start():]
         
@@ -245,70 +563,25 @@ class CricketQueryGenerator:
         
         query_lower = user_query.lower()
         
+        # Player names are bound as one array parameter, never spliced into the SQL text
+        params = (list(matched_players),) if matched_players else None
+        
         # Basic batting stats
-        if any(word in query_lower for word in ['runs', 'batting', 'average', 'strike rate']):
-            player_filter = ""
-            if matched_players:
-                player_names = "', '".join(matched_players)
-                player_filter = f"WHERE batter_full_name IN ('{player_names}')"
-            
-            sql_query = f"""
-            SELECT 
-                batter_full_name,
-                COUNT(*) as balls_faced,
-                SUM(runs_batter) as total_runs,
-                ROUND(AVG(runs_batter::numeric), 2) as avg_runs_per_ball,
-                ROUND((SUM(runs_batter) * 100.0 / COUNT(CASE WHEN valid_ball = 1 THEN 1 END)), 2) as strike_rate,
-                SUM(CASE WHEN is_four = true THEN 1 ELSE 0 END) as fours,
-                SUM(CASE WHEN is_six = true THEN 1 ELSE 0 END) as sixes
-            FROM ipl_data 
-            {player_filter}
-            GROUP BY batter_full_name 
-            HAVING COUNT(*) > 50
-            ORDER BY total_runs DESC 
-            LIMIT 20
-            """
+        if FALLBACK_BATTING_RE.search(query_lower):
+            sql_query = FALLBACK_BATTING_SQL[bool(matched_players)]
         
         # Basic bowling stats
-        elif any(word in query_lower for word in ['bowling', 'wickets', 'economy']):
-            player_filter = ""
-            if matched_players:
-                player_names = "', '".join(matched_players)
-                player_filter = f"WHERE bowler_full_name IN ('{player_names}')"
-            
-            sql_query = f"""
-            SELECT 
-                bowler_full_name,
-                COUNT(CASE WHEN valid_ball = 1 THEN 1 END) as balls_bowled,
-                SUM(runs_total) as runs_conceded,
-                COUNT(CASE WHEN is_wicket = true THEN 1 END) as wickets,
-                ROUND((SUM(runs_total) * 6.0 / COUNT(CASE WHEN valid_ball = 1 THEN 1 END)), 2) as economy_rate,
-                ROUND((SUM(runs_total) * 1.0 / NULLIF(COUNT(CASE WHEN is_wicket = true THEN 1 END), 0)), 2) as bowling_average
-            FROM ipl_data 
-            {player_filter}
-            GROUP BY bowler_full_name 
-            HAVING COUNT(CASE WHEN valid_ball = 1 THEN 1 END) > 100
-            ORDER BY wickets DESC 
-            LIMIT 20
-            """
+        elif FALLBACK_BOWLING_RE.search(query_lower):
+            sql_query = FALLBACK_BOWLING_SQL[bool(matched_players)]
         
         else:
             # Default query - top run scorers
-            sql_query = """
-            SELECT 
-                batter_full_name,
-                SUM(runs_batter) as total_runs,
-                COUNT(*) as balls_faced,
-                ROUND((SUM(runs_batter) * 100.0 / COUNT(CASE WHEN valid_ball = 1 THEN 1 END)), 2) as strike_rate
-            FROM ipl_data 
-            GROUP BY batter_full_name 
-            HAVING COUNT(*) > 100
-            ORDER BY total_runs DESC 
-            LIMIT 15
-            """
+            sql_query = FALLBACK_DEFAULT_SQL
+            params = None
         
         return {
             "sql_query": sql_query,
+            "params": params,
             "matched_players": matched_players,
             "original_query": user_query
         }
@@ -63,8 +63,9 @@ Try asking me anything about IPL cricket statistics!`,
 
   const loadSummaryStats = async () => {
     try {
-      const stats = await apiService.getSummaryStats();
-      setSummaryStats(stats);
+      // One request for all the startup lookups instead of one per endpoint
+      const bootstrap = await apiService.getBootstrap();
+      setSummaryStats(bootstrap.summary);
     } catch (error) {
       console.error('Failed to load summary stats:', error);
     }
@@ -1,5 +1,5 @@
 import axios from 'axios';
-import { ChatResponse, PlayerSuggestion, QueryValidation, SummaryStats } from '../types';
+import { BootstrapData, ChatResponse, PlayerSuggestion, QueryValidation, SummaryStats } from '../types';
 
 const API_BASE_URL = process.env.REACT_APP_API_URL || 'http://localhost:8000';
 
@@ -45,6 +45,12 @@ export const apiService = {
     return response.data;
   },
 
+  // Get players, teams, venues and summary statistics in one request
+  async getBootstrap(): Promise<BootstrapData> {
+    const response = await api.get('/bootstrap');
+    return response.data;
+  },
+
   // Validate query
   async validateQuery(query: string): Promise<QueryValidation> {
     const response = await api.post('/query/validate', { query });
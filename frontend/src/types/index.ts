@@ -25,6 +25,7 @@ export interface PlayerSuggestion {
 
 export interface QueryValidation {
   valid: boolean;
+  error?: string | null;
   sql_query?: string;
   matched_players?: string[];
   query_type?: string;
@@ -39,4 +40,11 @@ export interface SummaryStats {
   earliest_date: string;
   latest_date: string;
   total_balls: number;
+}
+
+export interface BootstrapData {
+  players: string[];
+  teams: string[];
+  venues: string[];
+  summary: SummaryStats;
 }
\ No newline at end of file
@@ -50,7 +50,7 @@ def test_all_queries():
         
         try:
             # Start timing
-            start_time = time.time()
+            start_ns = time.perf_counter_ns()
             
             # Step 1: Analyze query
             analysis = analyzer.analyze_complex_query(query_text)
@@ -63,7 +63,7 @@ def test_all_queries():
             result = execute_query(engine, sql_query)
             
             # Calculate execution time
-            execution_time = time.time() - start_time
+            execution_ns = time.perf_counter_ns() - start_ns
             
             # Check results
             is_success = isinstance(result, pd.DataFrame)
@@ -91,7 +91,7 @@ def test_all_queries():
             print(f"    Players: {analysis['entities']['players']}")
             print(f"    Teams: {analysis['entities']['teams']}")
             print(f"    Filters: {analysis['filters']}")
-            print(f"    Execution: {execution_time:.2f}s | Rows: {row_count} | {status}")
+            print(f"    Execution: {execution_ns / 1e9:.2f}s | Rows: {row_count} | {status}")
             
             # Store results
             results.append({
@@ -103,7 +103,7 @@ def test_all_queries():
                 'type_correct': type_correct,
                 'success': is_success,
                 'row_count': row_count,
-                'execution_time': execution_time,
+                'execution_ns': execution_ns,
                 'players_found': len(analysis['entities']['players']),
                 'teams_found': len(analysis['entities']['teams']),
                 'status': status.split()[1]  # Just the word part
@@ -121,7 +121,7 @@ def test_all_queries():
                 'type_correct': False,
                 'success': False,
                 'row_count': 0,
-                'execution_time': 0,
+                'execution_ns': 0,
                 'players_found': 0,
                 'teams_found': 0,
                 'status': 'ERROR'
@@ -171,7 +171,8 @@ def test_all_queries():
     
     successful_results = [r for r in results if r['success']]
     if successful_results:
-        avg_time = sum(r['execution_time'] for r in successful_results) / len(successful_results)
+        # Integer nanoseconds until here; one divide for the summary
+        avg_time = sum(r['execution_ns'] for r in successful_results) / len(successful_results) / 1e9
         avg_rows = sum(r['row_count'] for r in successful_results) / len(successful_results)
         print(f"Average Execution Time: {avg_time:.2f}s")
         print(f"Average Result Rows: {avg_rows:.0f}")
@@ -197,7 +198,7 @@ def test_all_queries():
     working_queries = [r for r in results if r['status'] == 'SUCCESS'][:5]
     for result in working_queries:
         print(f"✅ {result['query']}")
-        print(f"   Type: {result['detected_type']} | Rows: {result['row_count']} | Time: {result['execution_time']:.2f}s")
+        print(f"   Type: {result['detected_type']} | Rows: {result['row_count']} | Time: {result['execution_ns'] / 1e9:.2f}s")
     
     return results, success_rate
 